@@ -0,0 +1,70 @@
+from .exceptions import ServerBusy, RateLimitExceeded
+
+
+def get_client_key(config, headers, remote_addr):
+    """ Identify the client of a request for rate limiting. Behind a load
+        balancer, `rate_limit_client_header` names a header set by it, like
+        `X-Forwarded-For` or an API key header. Of a list of addresses, the
+        last one was added by the load balancer, the others could be forged
+        by the client. Requests without the header are limited by their
+        remote address.
+    """
+    header = config.rate_limit_client_header
+    if not header:
+        return remote_addr
+    value = headers.get(header, '').split(',')[-1].strip()
+    return value or remote_addr
+
+
+async def check_rate_limit(broker, config, client):
+    """ Take a token from the clients bucket, refilled with `rate_limit`
+        tokens per second up to `rate_limit_burst` tokens.
+    """
+    if not config.rate_limit or client is None:
+        return
+    wait = await broker.take_rate_limit_token(
+        client, config.rate_limit, config.rate_limit_burst
+    )
+    if wait > 0:
+        raise RateLimitExceeded(
+            f"Rate limit of {config.rate_limit} requests per second exceeded",
+            wait
+        )
+
+
+async def estimate_wait(broker):
+    """ Estimate the time until a newly queued job starts, from the length
+        of the queue, the average job duration and the number of workers.
+    """
+    duration = await broker.get_average_duration()
+    if duration is None:
+        return None
+    workers = await broker.get_worker_count()
+    return await broker.get_queue_length() * duration / max(workers, 1)
+
+
+async def check_admission(broker, config, process):
+    """ Reject new jobs when the queue, the jobs of the process or the
+        expected wait exceed their configured limits.
+    """
+    if config.admission_max_estimated_wait is not None:
+        estimated_wait = await estimate_wait(broker)
+        if estimated_wait is not None and \
+                estimated_wait > config.admission_max_estimated_wait:
+            raise ServerBusy(
+                f"Estimated wait of {estimated_wait:.0f} seconds exceeds the "
+                f"limit of {config.admission_max_estimated_wait} seconds",
+                estimated_wait - config.admission_max_estimated_wait
+            )
+
+    retry_after = config.admission_retry_after
+    if config.admission_max_queue_length is not None:
+        if await broker.get_queue_length() >= config.admission_max_queue_length:
+            raise ServerBusy("Too many queued jobs", retry_after)
+
+    if config.admission_max_inflight is not None:
+        count = await broker.get_inflight_count(process.identifier)
+        if count >= config.admission_max_inflight:
+            raise ServerBusy(
+                f"Too many jobs of process {process.identifier}", retry_after
+            )
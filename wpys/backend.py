@@ -1,8 +1,30 @@
-class NoSuchResult(Exception):
-    pass
+import asyncio
+import os
+
+from .config import WPySConfig
+from .exceptions import NoSuchResult
+from .redis.backend import RedisResultBackend
+from .filesystem.backend import FileSystemResultBackend
+from .tiered import TieredResultBackend
 
 
 RESULT_BACKEND = None
+# process and event loop the result backend connections belong to
+RESULT_BACKEND_OWNER = None
+
+async def get_result_backend(config: WPySConfig):
+    global RESULT_BACKEND, RESULT_BACKEND_OWNER
+
+    owner = (os.getpid(), asyncio.get_event_loop())
+    if RESULT_BACKEND is None or RESULT_BACKEND_OWNER != owner:
+        RESULT_BACKEND = None
+        if config.result_backend_type == "redis":
+            RESULT_BACKEND = await RedisResultBackend.get_backend(config)
+        elif config.result_backend_type == "filesystem":
+            RESULT_BACKEND = await FileSystemResultBackend.get_backend(config)
+        elif config.result_backend_type == "tiered":
+            RESULT_BACKEND = await TieredResultBackend.get_backend(config)
+        # TODO: other result backend types
+        RESULT_BACKEND_OWNER = owner
 
-async def get_result_backend(config):
-    pass
+    return RESULT_BACKEND
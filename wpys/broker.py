@@ -1,18 +1,26 @@
 from asyncio import AbstractEventLoop
+import os
 
 from .config import WPySConfig
 from .redis.broker import RedisBroker
 
 BROKER = None
+# process and event loop the broker connections belong to
+BROKER_OWNER = None
 
 async def get_broker(config: WPySConfig, loop: AbstractEventLoop):
-    global BROKER
+    global BROKER, BROKER_OWNER
 
-    if BROKER is None:
+    # connections can neither be used from another event loop nor shared with
+    # forked processes, these get their own broker
+    owner = (os.getpid(), loop)
+    if BROKER is None or BROKER_OWNER != owner:
+        BROKER = None
         if config.broker_type == "redis":
             BROKER = await RedisBroker.get_broker(
                 config, loop
             )
         # TODO: other broker types
+        BROKER_OWNER = owner
 
     return BROKER
@@ -0,0 +1,124 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# mimetypes of results worth compressing
+COMPRESSIBLE_MIMETYPES = (
+    'text/',
+    'application/xml',
+    'application/json',
+    'application/geo+json',
+    'application/gml+xml',
+    '+xml',
+    '+json',
+)
+
+
+def is_compressible(mimetype):
+    if not mimetype:
+        return False
+    mimetype = mimetype.split(';')[0].strip().lower()
+    return any(
+        mimetype.startswith(pattern) or mimetype.endswith(pattern)
+        for pattern in COMPRESSIBLE_MIMETYPES
+    )
+
+
+def choose_encoding(config, mimetype, size=None):
+    """ Choose the `Content-Encoding` a result is stored with, or `None` to
+        store it uncompressed.
+    """
+    encoding = config.result_compression
+    if not encoding or not is_compressible(mimetype):
+        return None
+    if size is not None and size < config.result_compression_min_size:
+        return None
+    if encoding == 'zstd' and zstandard is None:
+        encoding = 'deflate'
+    return encoding
+
+
+class Encoder:
+    """ Incrementally compresses data with the given encoding. Passes the
+        data through, when the encoding is `None`. With `sync_flush`, the
+        compressed data of each write is complete and can be decompressed
+        by readers right away, at a slight cost of compression.
+    """
+    def __init__(self, encoding=None, sync_flush=False):
+        self.encoding = encoding
+        self.sync_flush = sync_flush
+        if encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        elif encoding == 'deflate':
+            self._compressor = zlib.compressobj()
+        else:
+            self._compressor = None
+
+    def encode(self, data):
+        if self._compressor is None:
+            return data
+        data = self._compressor.compress(data)
+        if self.sync_flush:
+            if self.encoding == 'zstd':
+                data += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            else:
+                data += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def finish(self):
+        if self._compressor is None:
+            return b''
+        return self._compressor.flush()
+
+
+def get_decompressor(encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    elif encoding == 'deflate':
+        return zlib.decompressobj()
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def accepts_encoding(header, encoding):
+    """ Check whether an `Accept-Encoding` header allows the encoding. An
+        entry naming the encoding takes precedence over `*`.
+    """
+    if not header:
+        return False
+
+    qualities = {}
+    for value in header.split(','):
+        name, _, params = value.partition(';')
+        name = name.strip().lower()
+        if name not in (encoding, '*'):
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, param_value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0
+        qualities[name] = quality
+
+    quality = qualities.get(encoding, qualities.get('*', 0))
+    return quality > 0
+
+
+async def decode_stream(chunks, encoding):
+    """ Decompress an async iterator of chunks of a compressed result.
+    """
+    decompressor = get_decompressor(encoding)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if hasattr(decompressor, 'flush'):
+        data = decompressor.flush()
+        if data:
+            yield data
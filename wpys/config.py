@@ -1,5 +1,7 @@
 import os
+import re
 import yaml
+from urllib.parse import urlparse, quote, unquote
 from dataclasses import dataclass, field
 from typing import List
 
@@ -35,9 +37,33 @@ class ProcessConfig:
 @dataclass
 class WPySConfig:
     main_endpoint_name: str = "/"
+    # public base URL of the server, e.g. "https://wps.example.com". Result
+    # URLs in Result documents start with it. Absolute result URLs referenced
+    # as inputs are only outputs of jobs of this server, when they start with
+    # it.
+    server_url: str = None
     result_endpoint_name: str = "/result/<uuid:job_id>/<result_name>"
+    # Server-Sent Events with the status of one or more comma separated jobs
+    status_stream_endpoint_name: str = "/status/<job_ids>"
+    status_stream_heartbeat_interval: float = 15
 
     result_chunk_size: int = 65535
+    # encoding of stored results with a compressible mimetype: "zstd",
+    # "deflate" or None to disable compression
+    result_compression: str = "deflate"
+    result_compression_min_size: int = 1024
+
+    # polling interval and maximum idle time when following a result that
+    # is still being written
+    result_tail_interval: float = 0.5
+    result_tail_timeout: float = 300
+
+    # outputs up to this size in bytes are sent by value in Result
+    # documents, larger ones by reference to the result endpoint
+    inline_result_max_size: int = 4096
+    # with the "tiered" result backend, larger outputs up to this size are
+    # stored in Redis and all others on the filesystem
+    result_redis_max_size: int = 1048576
 
     broker_type: str = "redis"
     broker_options: dict = field(default_factory=dict)
@@ -47,6 +73,71 @@ class WPySConfig:
 
     expiration_time: float = None
 
+    # admission control of Execute requests: limits of the queued jobs, of
+    # the queued and running jobs per process and of the estimated wait in
+    # seconds, `None` disables a limit. Rejected requests are answered with
+    # 503 and a Retry-After header.
+    admission_max_queue_length: int = None
+    admission_max_inflight: int = None
+    admission_max_estimated_wait: float = None
+    admission_retry_after: float = 10
+    # Execute requests per second and client, with bursts of up to
+    # `rate_limit_burst` requests
+    rate_limit: float = None
+    rate_limit_burst: int = 10
+    # header identifying the client, set by a trusted load balancer, e.g.
+    # "X-Forwarded-For" or an API key header. The remote address by default.
+    rate_limit_client_header: str = None
+    # interval of the heartbeats workers are counted with
+    worker_heartbeat_interval: float = 10
+    # number of blocking calls of dismissed jobs a worker leaves running in
+    # background threads, before it waits for them instead
+    worker_max_abandoned_calls: int = 4
+
+    # time a synchronous Execute request waits for the job, before it
+    # responds with a StatusInfo like an asynchronous one
+    sync_execute_max_wait: float = 30
+    # upper limit of the time a GetStatus request waits for a status change
+    status_max_wait: float = 60
+    # number of encoded StatusInfo documents kept in memory by the server,
+    # 0 to disable the cache
+    status_cache_max_entries: int = 10000
+    # seconds a cached StatusInfo document is served at most
+    status_cache_max_age: float = 5
+
+    # maximum total size in bytes of the outputs of completed jobs, the least
+    # recently used jobs are evicted beyond it
+    retention_max_size: int = None
+    # interval in seconds of the sweeps evicting jobs and removing orphaned
+    # results and queue entries, and the number of entries handled per step
+    retention_sweep_interval: float = 300
+    retention_sweep_batch_size: int = 100
+
+    # lease of a running job on a slot of a processes `max_concurrency`
+    concurrency_lease_time: float = 60
+    # delay before retrying, when all queued jobs are at their concurrency limit
+    concurrency_retry_delay: float = 1
+
+    # time and number of entries results of cacheable processes are kept
+    cache_expiration_time: float = 3600
+    cache_max_entries: int = 10000
+
+    # serving with `python -m wpys.serve`: address to listen on, number of
+    # server processes (defaults to the number of CPUs) and their event loop,
+    # "asyncio" or "uvloop"
+    server_bind: str = "127.0.0.1:8000"
+    server_processes: int = None
+    server_event_loop: str = "asyncio"
+
+    # outputs up to this size in bytes are kept in the memory of the worker
+    # that produced them, up to `handoff_cache_max_size` bytes in total, and
+    # passed directly to chained jobs run by the same worker
+    handoff_max_size: int = 8388608
+    handoff_cache_max_size: int = 67108864
+
+    # time the server waits for active requests when shutting down
+    shutdown_timeout: float = 30
+
     debug: bool = False
     pretty_print: bool = True
 
@@ -55,6 +146,45 @@ class WPySConfig:
 
     logging: dict = field(default_factory=dict)
 
+    def get_result_url(self, job_id, result_name):
+        """ Build the URL of a result from the `result_endpoint_name` route,
+            absolute when `server_url` is set.
+        """
+        url = re.sub(r'<([^:>]+:)?job_id>', str(job_id), self.result_endpoint_name)
+        url = re.sub(
+            r'<([^:>]+:)?result_name>',
+            lambda match: quote(result_name, safe=''), url
+        )
+        if self.server_url:
+            url = self.server_url.rstrip('/') + url
+        return url
+
+    def parse_result_url(self, url):
+        """ Get the job ID and result name from a URL of the
+            `result_endpoint_name` route, or `None` if it is no result URL of
+            this server. URLs of other hosts than `server_url` are external.
+        """
+        parsed = urlparse(url)
+        path = parsed.path
+        if parsed.scheme or parsed.netloc:
+            server = urlparse(self.server_url or '')
+            if (parsed.scheme, parsed.netloc.lower()) != (
+                    server.scheme, server.netloc.lower()) or not server.netloc:
+                return None
+            # the route is relative to the path of the server
+            prefix = server.path.rstrip('/')
+            if not path.startswith(prefix + '/'):
+                return None
+            path = path[len(prefix):]
+
+        pattern = re.escape(self.result_endpoint_name)
+        pattern = re.sub(r'<([^:>]+:)?job_id>', r'(?P<job_id>[^/]+)', pattern)
+        pattern = re.sub(r'<([^:>]+:)?result_name>', r'(?P<result_name>[^/]+)', pattern)
+        match = re.fullmatch(pattern, path)
+        if not match:
+            return None
+        return match.group('job_id'), unquote(match.group('result_name'))
+
     @classmethod
     def from_config(cls, conf):
         conf['service_info'] = ServiceInfo(**conf.pop('service_info', {}))
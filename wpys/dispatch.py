@@ -1,14 +1,23 @@
 from uuid import uuid4
+from math import ceil
+import asyncio
 
 from .config import WPySConfig
 from .encoding import (
-    Capabilities, ProcessOfferings, StatusInfo, Result, ExceptionReport, encode_response
+    Capabilities, ProcessOfferings, StatusInfo, StatusInfoList, Result,
+    ExceptionReport, EncodedResponse, encode_response
 )
 from .parsing import (
     GetCapabilitiesRequest, DescribeProcessRequest, ExecuteRequest,
-    GetStatusRequest, GetResultRequest, DismissRequest
+    GetStatusRequest, GetResultRequest, DismissRequest, PauseRequest,
+    ResumeRequest
 )
-from .job import JobStatus
+from .job import (
+    JobStatus, JobException, JobOutputReference, ResourceLimits, FINAL_STATUSES
+)
+from .exceptions import ResultNotReady, ServerBusy
+from .admission import check_rate_limit, check_admission
+from .status_cache import get_status_cache
 
 
 __all__ = ['dispatch']
@@ -25,6 +34,15 @@ def handles(request_type):
     return _inner
 
 
+def get_result_document(job, config):
+    """ Use the Result document rendered by the worker, only the results of
+        running jobs are encoded here.
+    """
+    if job.result_document is not None:
+        return EncodedResponse(job.result_document)
+    return Result.from_job(job, config)
+
+
 @handles(GetCapabilitiesRequest)
 async def handle_get_capabilities(process_registry, broker, config, wps_request):
     service_info = config.service_info
@@ -50,38 +68,177 @@ async def handle_describe_process(process_registry, broker, config, wps_request)
     return ProcessOfferings(processes=process_registry.processes)
 
 
+async def get_job_output_references(broker, config, inputs):
+    """ Find the inputs referencing the result URL of an output of another
+        job. The jobs must exist and not have failed.
+    """
+    references = {}
+    for input_ in inputs:
+        if input_.reference is None or not input_.reference.href:
+            continue
+        parsed = config.parse_result_url(input_.reference.href)
+        if parsed is None:
+            continue
+        job_id, output_id = parsed
+        references[input_.identifier] = JobOutputReference(
+            job_id, output_id, input_.identifier
+        )
+
+    job_ids = list({reference.job_id for reference in references.values()})
+    for job_id, job in zip(job_ids, await broker.get_jobs(job_ids)):
+        if job is None:
+            raise JobException(f"Job {job_id} does not exist")
+        elif job.status in (JobStatus.FAILED, JobStatus.DISMISSED):
+            raise JobException(f"Job {job_id} is {job.status}")
+        for reference in references.values():
+            if reference.job_id == job_id and not any(
+                    output.identifier == reference.output_id
+                    for output in job.process.outputs):
+                raise JobException(
+                    f"Job {job_id} has no output {reference.output_id}"
+                )
+    return references
+
+
 @handles(ExecuteRequest)
 async def handle_execute(process_registry, broker, config, wps_request):
     process = process_registry.get_process(wps_request.identifier)
+    references = await get_job_output_references(broker, config, wps_request.inputs)
+    inputs = process.parse_inputs(wps_request.inputs, references)
+
+    cache_key = None
+    if process.cacheable:
+        # reuse the completed job of an identical request
+        cache_key = process.get_cache_key(inputs, wps_request.outputs)
+        job = await broker.get_cached_job(cache_key)
+        if job is not None:
+            if wps_request.mode == "async":
+                return StatusInfo.from_job(job)
+            return get_result_document(job, config)
+
+    await check_admission(broker, config, process)
+
+    limits = process.limits.restrict(ResourceLimits(
+        timeout=wps_request.timeout,
+        cpu_time=wps_request.cpu_time,
+        memory=wps_request.memory_limit,
+    ))
     job = await broker.create_job(
-        str(uuid4()), process, wps_request.inputs, wps_request.outputs
+        str(uuid4()), process, inputs, wps_request.outputs, limits, cache_key,
+        dependencies=sorted({reference.job_id for reference in references.values()}),
     )
-    await broker.enqueue_job(job.identifier)
     if wps_request.mode == "async":
+        await broker.submit_job(job)
         return StatusInfo.from_job(job)
-    else:
-        while True:
-            await broker.get_job_notification(
-                job.identifier, ["succeded", "failed", "dismissed"]
-            )
-            job = await broker.get_job(job.identifier)
-            if job.status == JobStatus.SUCCEEDED:
-                return Result.from_job(job)
-            elif job.status == JobStatus.FAILED:
-                return ExceptionReport.from_job(job)
-            else:
-                return StatusInfo.from_job(job)
+
+    # watch the job before enqueueing it, so that no update is missed
+    queue = await broker.watch_job_status(job.identifier)
+    try:
+        await broker.submit_job(job)
+        job = await wait_for_job(
+            broker, job, queue, lambda job: job.status in FINAL_STATUSES,
+            config.sync_execute_max_wait,
+        )
+    finally:
+        broker.unwatch_job_status(job.identifier, queue)
+
+    if job.status == JobStatus.SUCCEEDED:
+        return get_result_document(job, config)
+    elif job.status == JobStatus.FAILED:
+        return ExceptionReport.from_job(job)
+    # continue asynchronously, when the job took too long
+    return StatusInfo.from_job(job)
+
+
+async def wait_for_job(broker, job, queue, done, timeout):
+    """ Wait until `done` is true for the latest state of the job, or the
+        timeout passed. `queue` must be watching the status channel of the
+        job. Returns the latest state of the job.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    # the job could have been updated before watching its channel
+    job = await broker.get_job(job.identifier)
+    while not done(job):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            break
+        job = await broker.get_job(job.identifier)
+    return job
+
+
+async def wait_for_status_change(broker, job, status, percent_completed, timeout):
+    """ Wait until the status or progress of the job differs from the given
+        ones, or the timeout passed. Returns the latest state of the job.
+    """
+    if status is None:
+        status = str(job.status)
+    if percent_completed is None:
+        percent_completed = job.percent_completed
+
+    def changed(job):
+        return str(job.status) != status or job.percent_completed != percent_completed
+
+    if changed(job):
+        return job
+
+    queue = await broker.watch_job_status(job.identifier)
+    try:
+        return await wait_for_job(broker, job, queue, changed, timeout)
+    finally:
+        broker.unwatch_job_status(job.identifier, queue)
 
 
 @handles(GetStatusRequest)
 async def handle_get_status(process_registry, broker, config, wps_request):
-    job = await broker.get_job(wps_request.job_id)
-    return StatusInfo.from_job(job)
+    if len(wps_request.job_ids) > 1:
+        # the status of all jobs is fetched at once, without waiting
+        jobs = await broker.get_jobs(wps_request.job_ids)
+        return StatusInfoList(
+            status_infos=[StatusInfo.from_job(job) for job in jobs if job is not None],
+            missing_job_ids=[
+                job_id for job_id, job in zip(wps_request.job_ids, jobs)
+                if job is None
+            ],
+        )
+
+    if wps_request.wait_for:
+        job = await broker.get_job(wps_request.job_id)
+        job = await wait_for_status_change(
+            broker, job, wps_request.last_status,
+            wps_request.last_percent_completed,
+            min(wps_request.wait_for, config.status_max_wait),
+        )
+        return StatusInfo.from_job(job)
+
+    # serve unchanged jobs from memory
+    status_cache = await get_status_cache(broker, config)
+    if status_cache is None:
+        return StatusInfo.from_job(await broker.get_job(wps_request.job_id))
+
+    data = status_cache.get(wps_request.job_id)
+    if data is None:
+        token = status_cache.reserve(wps_request.job_id)
+        job = await broker.get_job(wps_request.job_id)
+        data = encode_response(StatusInfo.from_job(job), config)
+        status_cache.put(wps_request.job_id, token, data)
+    return EncodedResponse(data)
 
 
 @handles(GetResultRequest)
 async def handle_get_result(process_registry, broker, config, wps_request):
-    pass
+    job = await broker.get_job(wps_request.job_id)
+    # with `partial`, running jobs reference the outputs written so far,
+    # which can be followed until they are complete
+    if job.status == JobStatus.SUCCEEDED or (
+            wps_request.partial and job.status == JobStatus.RUNNING):
+        await broker.touch_job(job.identifier)
+        return get_result_document(job, config)
+    raise ResultNotReady(f"Job {job.identifier} is {job.status}")
 
 
 @handles(DismissRequest)
@@ -90,15 +247,55 @@ async def handle_dismiss(process_registry, broker, config, wps_request):
     return StatusInfo.from_job(await broker.get_job(wps_request.job_id))
 
 
-async def dispatch(process_registry, broker, config: WPySConfig, wps_request):
-    """ The main request dispatching function.
+@handles(PauseRequest)
+async def handle_pause(process_registry, broker, config, wps_request):
+    await broker.pause_job(wps_request.job_id)
+    return StatusInfo.from_job(await broker.get_job(wps_request.job_id))
+
+
+@handles(ResumeRequest)
+async def handle_resume(process_registry, broker, config, wps_request):
+    await broker.resume_job(wps_request.job_id)
+    return StatusInfo.from_job(await broker.get_job(wps_request.job_id))
+
+
+# encoded documents that do not depend on the request, rendered at startup
+PRERENDERED_DOCUMENTS = {}
+
+async def prerender_documents(process_registry, broker, config: WPySConfig):
+    for request_type in (GetCapabilitiesRequest, DescribeProcessRequest):
+        response = await REQUEST_HANDLERS[request_type](
+            process_registry, broker, config, None
+        )
+        PRERENDERED_DOCUMENTS[request_type] = encode_response(response, config)
+
+
+async def dispatch(process_registry, broker, config: WPySConfig, wps_request,
+                   client=None):
+    """ The main request dispatching function. Execute requests are rate
+        limited per `client`.
     """
+    document = PRERENDERED_DOCUMENTS.get(type(wps_request))
+    if document is not None:
+        return document, 200, {'Content-Type': 'application/xml'}
 
     try:
+        if isinstance(wps_request, ExecuteRequest):
+            await check_rate_limit(broker, config, client)
         result = await REQUEST_HANDLERS[type(wps_request)](
             process_registry, broker, config, wps_request
         )
         return encode_response(result, config), 200, {'Content-Type': 'application/xml'}
+    except ServerBusy as e:
+        retry_after = e.retry_after
+        if retry_after is None:
+            retry_after = config.admission_retry_after
+        return encode_response(
+            ExceptionReport.from_exception(e, config), config
+        ), e.status_code, {
+            'Content-Type': 'application/xml',
+            'Retry-After': str(ceil(retry_after)),
+        }
     except Exception as e:
         return encode_response(
             ExceptionReport.from_exception(e, config), config
@@ -3,6 +3,8 @@ from typing import List, Tuple, Callable, Union, Any, ClassVar
 from datetime import datetime
 from traceback import format_tb, format_exception
 from functools import partial
+from base64 import b64encode
+import re
 
 from lxml import etree
 from lxml.builder import ElementMaker
@@ -10,6 +12,14 @@ from lxml.builder import ElementMaker
 from .process import LiteralData, ComplexData, BoundingBoxData
 from .config import WPySConfig
 
+# characters that cannot appear in XML 1.0 documents
+XML_INVALID_CHARACTERS = re.compile(
+    '[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]'
+)
+# mimetypes of outputs that are embedded as text, others are base64 encoded
+TEXT_MIMETYPES = ('application/json', 'application/xml')
+TEXT_MIMETYPE_SUFFIXES = ('+json', '+xml')
+
 
 class BetterElementMaker(ElementMaker):
     def __call__(self, *args, **kwargs):
@@ -303,15 +313,113 @@ class StatusInfo:
             # ) if self.traceback else None
         )
 
+@dataclass
+class StatusInfoList:
+    """ The status of several jobs, jobs that do not exist are reported with
+        a `NoSuchJob` exception.
+    """
+    status_infos: List[StatusInfo] = ()
+    missing_job_ids: List[str] = ()
+
+    def encode_tree(self):
+        return WPS("StatusInfoList", *[
+            status_info.encode_tree()
+            for status_info in self.status_infos
+        ], *[
+            OWS("Exception",
+                OWS("ExceptionText", f"Job {job_id} does not exist"),
+                exceptionCode="NoSuchJob",
+                locator=job_id,
+            )
+            for job_id in self.missing_job_ids
+        ])
+
+def is_text_mimetype(mimetype):
+    """ Outputs without a mimetype are literal values, thus text.
+    """
+    if not mimetype:
+        return True
+    mimetype = mimetype.split(';')[0].strip().lower()
+    return (
+        mimetype.startswith('text/') or mimetype in TEXT_MIMETYPES
+        or mimetype.endswith(TEXT_MIMETYPE_SUFFIXES)
+    )
+
+
+@dataclass
+class ResultOutput:
+    identifier: str
+    href: str = None
+    data: str = None
+    mimetype: str = None
+    encoding: str = None
+
+    @classmethod
+    def from_data(cls, identifier, data, mimetype=None):
+        """ Create an inline output. Binary data, and text that cannot be
+            put into XML, is base64 encoded.
+        """
+        if is_text_mimetype(mimetype):
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+            else:
+                if not XML_INVALID_CHARACTERS.search(text):
+                    return cls(identifier, data=text, mimetype=mimetype)
+        return cls(
+            identifier, data=b64encode(data).decode('ascii'),
+            mimetype=mimetype, encoding='base64',
+        )
+
+    def encode_tree(self):
+        if self.href:
+            content = WPS("Reference", xlink("href", self.href), mimeType=self.mimetype)
+        else:
+            content = WPS("Data", self.data, mimeType=self.mimetype, encoding=self.encoding)
+        return WPS("Output", content, id=self.identifier)
+
 @dataclass
 class Result:
+    job_id: str
+    outputs: List[ResultOutput] = ()
+    expiration_date: datetime = None
 
     @classmethod
-    def from_job(cls, job):
-        pass
+    def from_job(cls, job, config):
+        """ Small outputs are sent by value from the job record, unless a
+            reference was requested. Larger outputs are always referenced.
+        """
+        transmissions = {
+            output.identifier: output.transmission for output in job.outputs
+        }
+        outputs = []
+        for result in job.results:
+            if job.outputs and result.identifier not in transmissions:
+                continue
+            if result.data is not None and transmissions.get(result.identifier) != 'reference':
+                outputs.append(ResultOutput.from_data(
+                    result.identifier, result.data, result.mimetype
+                ))
+            else:
+                outputs.append(ResultOutput(
+                    identifier=result.identifier,
+                    href=config.get_result_url(job.identifier, result.identifier),
+                    mimetype=result.mimetype,
+                ))
+        return cls(job_id=job.identifier, outputs=outputs)
 
     def encode_tree(self):
-        pass
+        return WPS("Result",
+            WPS("JobID", self.job_id),
+            WPS(
+                "ExpirationDate", self.expiration_date.isoformat("T")
+            ) if self.expiration_date else None, *[
+                output.encode_tree()
+                for output in self.outputs
+            ],
+            SCHEMA_LOCATION
+        )
 
 @dataclass
 class ExceptionReport:
@@ -320,7 +428,12 @@ class ExceptionReport:
 
     @classmethod
     def from_job(cls, job, config=None):
-        pass
+        """ Report the exception a failed job was terminated with.
+        """
+        exception = getattr(job, 'exception', None)
+        if exception is None:
+            exception = Exception(f"Job {job.identifier} failed")
+        return cls(exceptions=[exception])
 
     @classmethod
     def from_exception(cls, exc, config=None):
@@ -350,7 +463,16 @@ class ExceptionReport:
             for exception in self.exceptions
         ])
 
+@dataclass
+class EncodedResponse(Response):
+    """ A response document that was already encoded, e.g. the Result
+        document rendered by the worker.
+    """
+    data: bytes
+
 def encode_response(response: Response, config: WPySConfig):
+    if isinstance(response, EncodedResponse):
+        return response.data
     return etree.tostring(
         response.encode_tree(), pretty_print=config.pretty_print
     )
@@ -0,0 +1,74 @@
+import asyncio
+
+from .encoding import StatusInfo, encode_response
+from .job import JobException, FINAL_STATUSES
+
+
+def format_event(data, event=None):
+    """ Encode a Server-Sent Event, each line of data is sent as its own
+        `data` field.
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.splitlines() or [''])
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+async def status_events(broker, config, job_ids):
+    """ Stream the StatusInfo of the jobs as Server-Sent Events: once on
+        connection, and then whenever a job is updated. Updates received
+        while the client is still reading are coalesced, so that a slow
+        client gets the latest state of each job instead of a backlog. A
+        comment is sent as heartbeat when nothing happened for a while, and
+        the stream ends when all jobs are finished.
+    """
+    changed = set()
+    wakeup = asyncio.Event()
+
+    async def forward(job_id, queue):
+        while True:
+            await queue.get()
+            changed.add(job_id)
+            wakeup.set()
+
+    queues = {job_id: await broker.watch_job_status(job_id) for job_id in job_ids}
+    forwarders = [
+        asyncio.ensure_future(forward(job_id, queue))
+        for job_id, queue in queues.items()
+    ]
+    # send the current state of all jobs first
+    changed.update(job_ids)
+    active = set(job_ids)
+
+    try:
+        while active:
+            if not changed:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        wakeup.wait(), config.status_stream_heartbeat_interval
+                    )
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+
+            pending, changed = changed, set()
+            for job_id in pending:
+                try:
+                    job = await broker.get_job(job_id)
+                except JobException as e:
+                    active.discard(job_id)
+                    yield format_event(str(e), event="error")
+                    continue
+
+                if job.status in FINAL_STATUSES:
+                    active.discard(job_id)
+                yield format_event(
+                    encode_response(StatusInfo.from_job(job), config).decode('utf-8'),
+                    event="status",
+                )
+    finally:
+        # also run when the client disconnected
+        for forwarder in forwarders:
+            forwarder.cancel()
+        for job_id, queue in queues.items():
+            broker.unwatch_job_status(job_id, queue)
@@ -0,0 +1,21 @@
+class NoSuchResult(Exception):
+    pass
+
+
+class ResultNotReady(Exception):
+    pass
+
+
+class ServerBusy(Exception):
+    """ The request was rejected to shed load, it can be retried after
+        `retry_after` seconds.
+    """
+    status_code = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(ServerBusy):
+    status_code = 429
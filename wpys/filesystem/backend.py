@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import shutil
+
+from ..exceptions import NoSuchResult
+from ..job import to_bytes
+from ..compression import Encoder, choose_encoding
+
+# the metadata of a result is kept next to it, in a hidden file: result names
+# cannot start with '.', so it cannot be overwritten by another result
+METADATA_PREFIX = "."
+METADATA_SUFFIX = ".json"
+
+
+def _metadata_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f"{METADATA_PREFIX}{name}{METADATA_SUFFIX}")
+
+
+def _write_metadata(path, metadata):
+    # write to a temporary file first, so that readers never see a partial file
+    metadata_path = _metadata_path(path)
+    tmp_path = f"{metadata_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(tmp_path, metadata_path)
+
+
+def _read_metadata(path):
+    try:
+        with open(_metadata_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class FileResult:
+    """ File-like reader of a result file. Data is read from a memory map of
+        the file, so only the requested chunks are held in memory. Each chunk
+        is copied to bytes, as response bodies have to be bytes.
+    """
+    def __init__(self, path, mimetype=None, encoding=None):
+        self.path = path
+        self.mimetype = mimetype
+        self.encoding = encoding
+        self._file = open(path, 'rb')
+        self._map = None
+        self._offset = 0
+
+    def _mapped(self):
+        # remap when the file grew since the last read
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is None or len(self._map) != size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(
+                self._file.fileno(), size, access=mmap.ACCESS_READ
+            ) if size else None
+        return self._map
+
+    async def read(self, size=None):
+        mapped = self._mapped()
+        if mapped is None:
+            return b''
+        end = len(mapped) if size is None else min(self._offset + size, len(mapped))
+        data = mapped[self._offset:end]
+        self._offset += len(data)
+        return data
+
+    async def seek(self, offset, from_what=0):
+        if from_what == 0:
+            self._offset = offset
+        elif from_what == 1:
+            self._offset += offset
+        elif from_what == 2:
+            self._offset = await self.size() + offset
+
+    def tell(self):
+        return self._offset
+
+    async def size(self):
+        """ The size of the stored, possibly compressed data.
+        """
+        return os.fstat(self._file.fileno()).st_size
+
+    async def original_size(self):
+        """ The size of the uncompressed data.
+        """
+        metadata = _read_metadata(self.path)
+        return metadata.get('original_size') if metadata else None
+
+    async def is_complete(self):
+        metadata = _read_metadata(self.path)
+        if metadata is None:
+            raise NoSuchResult(f"Result {self.path} was deleted")
+        return metadata['complete']
+
+    async def etag(self):
+        """ Content hash of the completed result.
+        """
+        metadata = _read_metadata(self.path)
+        return metadata.get('etag') if metadata else None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+class FileResultWriter:
+    """ Appends to a result file, blocking writes are run in an executor.
+    """
+    tier = "filesystem"
+
+    def __init__(self, path, mimetype=None, encoding=None, sync_flush=False):
+        self.path = path
+        self.mimetype = mimetype
+        self.encoding = encoding
+        self.size = 0
+        self.original_size = 0
+        self._file = open(path, 'wb')
+        self._hash = hashlib.sha256()
+        self._encoder = Encoder(encoding, sync_flush)
+
+    async def write(self, data):
+        data = to_bytes(data)
+        self._hash.update(data)
+        self.original_size += len(data)
+        await self._append(self._encoder.encode(data))
+
+    async def _append(self, data):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write, data)
+        self.size += len(data)
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+
+    async def close(self):
+        await self._append(self._encoder.finish())
+        self._file.close()
+        _write_metadata(self.path, {
+            'mimetype': self.mimetype,
+            'encoding': self.encoding,
+            'original_size': self.original_size,
+            'complete': True,
+            'etag': self._hash.hexdigest(),
+        })
+
+
+class FileSystemResultBackend:
+    """ Stores each result as a file in a directory per job, on a local or
+        shared filesystem.
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+
+    def _get_path(self, job_id, output_name):
+        if os.sep in output_name or output_name.startswith('.'):
+            raise NoSuchResult(f"Invalid result name {output_name}")
+        return os.path.join(self.path, str(job_id), output_name)
+
+    async def open_job_result(self, job_id, output_name, mimetype=None,
+                              size=None) -> FileResultWriter:
+        """ Create a new, empty result and return a writer to append to it.
+            The result is compressed depending on its mimetype and expected
+            size.
+        """
+        encoding = choose_encoding(self.config, mimetype, size)
+        path = self._get_path(job_id, output_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_metadata(path, {
+            'mimetype': mimetype, 'encoding': encoding, 'complete': False
+        })
+        # outputs of unknown size are written incrementally and read while
+        # being written
+        return FileResultWriter(path, mimetype, encoding, sync_flush=size is None)
+
+    async def put_job_result(self, job_id, output_name, result, mimetype=None):
+        result = to_bytes(result)
+        writer = await self.open_job_result(job_id, output_name, mimetype, len(result))
+        await writer.write(result)
+        await writer.close()
+
+    async def get_job_result(self, job_id, output_name) -> FileResult:
+        path = self._get_path(job_id, output_name)
+        metadata = _read_metadata(path)
+        if metadata is None or not os.path.exists(path):
+            raise NoSuchResult(f"No result {output_name} for job {job_id}")
+        return FileResult(path, metadata['mimetype'], metadata.get('encoding'))
+
+    async def delete_job_result(self, job_id, output_name):
+        path = self._get_path(job_id, output_name)
+        for filename in (path, _metadata_path(path)):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    async def delete_job_results(self, job_id):
+        shutil.rmtree(os.path.join(self.path, str(job_id)), ignore_errors=True)
+
+    async def iter_job_results(self):
+        """ Iterate over the job IDs and output names of all stored results.
+        """
+        for job_entry in os.scandir(self.path):
+            if not job_entry.is_dir():
+                continue
+            for entry in os.scandir(job_entry.path):
+                # skip the metadata files
+                if not entry.name.startswith(METADATA_PREFIX):
+                    yield job_entry.name, entry.name
+            await asyncio.sleep(0)
+
+    async def close(self):
+        pass
+
+    @classmethod
+    async def get_backend(cls, config, loop=None):
+        path = config.result_backend_options.get('path', 'results')
+        os.makedirs(path, exist_ok=True)
+        return cls(path, config)
@@ -20,6 +20,67 @@ class JobStatus(Enum):
         return self.value
 
 
+# statuses after which a job does not change anymore
+FINAL_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.DISMISSED)
+
+
+@dataclass
+class ResourceLimits:
+    """ Limits enforced on a running job: `timeout` is the wall clock time and
+        `cpu_time` the CPU time in seconds, `memory` the maximum size of the
+        address space in bytes.
+    """
+    timeout: float = None
+    cpu_time: float = None
+    memory: int = None
+
+    def restrict(self, other):
+        """ Combine with another set of limits, taking the stricter value of
+            each limit.
+        """
+        def stricter(a, b):
+            if a is None:
+                return b
+            elif b is None:
+                return a
+            return min(a, b)
+
+        return ResourceLimits(
+            timeout=stricter(self.timeout, other.timeout),
+            cpu_time=stricter(self.cpu_time, other.cpu_time),
+            memory=stricter(self.memory, other.memory),
+        )
+
+    def __bool__(self):
+        return any(
+            limit is not None
+            for limit in (self.timeout, self.cpu_time, self.memory)
+        )
+
+
+@dataclass
+class JobResult:
+    """ A stored output of a job. The value of small outputs is kept in
+        `data`, so that it can be sent inline without fetching it from the
+        result backend. `tier` is the storage the output was written to.
+    """
+    identifier: str
+    mimetype: str = None
+    size: int = None
+    data: bytes = None
+    tier: str = None
+
+
+@dataclass
+class JobOutputReference:
+    """ An input taking the value of an output of another job. It is
+        resolved by the worker, once that job succeeded.
+    """
+    job_id: str
+    output_id: str
+    input_id: str
+
+
 @dataclass
 class Job:
     identifier: str
@@ -35,17 +96,82 @@ class Job:
     estimated_completion: datetime = None
     next_poll: datetime = None
 
+    checkpoint: Any = None
+    limits: ResourceLimits = None
+    cache_key: str = None
+    # the Result document, rendered when the job succeeded
+    result_document: bytes = None
+    # IDs of the jobs whose outputs are inputs of this job, it is held until
+    # they all succeeded
+    dependencies: Sequence[str] = ()
+    # ID of the worker that ran the job
+    worker: str = None
+    # the queue the job was last put into
+    queue: str = None
+
 class JobException(Exception):
     pass
 
 
+class ResourceLimitExceeded(JobException):
+    pass
+
+
+class JobTimeout(ResourceLimitExceeded):
+    pass
+
+
 class Status:
-    percent_completed: int = None
+    """ Yielded by processes to report their progress. The estimated
+        completion and next poll can be given as a `datetime` or as a
+        `timedelta` from now.
+    """
+    def __init__(self, percent_completed=None, estimated_completion=None,
+                 next_poll=None):
+        self.percent_completed = percent_completed
+        self.estimated_completion = estimated_completion
+        self.next_poll = next_poll
+
+    def apply(self, job):
+        now = datetime.now()
+        job.percent_completed = self.percent_completed
+        job.estimated_completion = self.estimated_completion
+        if isinstance(self.estimated_completion, timedelta):
+            job.estimated_completion = now + self.estimated_completion
+        job.next_poll = self.next_poll
+        if isinstance(self.next_poll, timedelta):
+            job.next_poll = now + self.next_poll
 
 
 class Result:
-    def __init__(self, output):
+    """ The value of an output of the job. Without an identifier, the result
+        is stored for the first output of the process. The value can also be
+        an `Output`, a file-like object or an iterator of chunks, which are
+        streamed to the result backend.
+    """
+    def __init__(self, output, identifier=None):
         self.output = output
+        self.identifier = identifier
+
+
+class ResultPart:
+    """ A piece of data appended to an output. Generator processes can yield
+        these repeatedly to write an output incrementally, it is completed
+        when the job finishes. Once a job wrote a part, it cannot be paused
+        anymore.
+    """
+    def __init__(self, data, identifier=None):
+        self.data = data
+        self.identifier = identifier
+
+
+class Checkpoint:
+    """ Yielded by generator processes to store a state object with the job.
+        When the job is paused and later resumed, the latest state is passed
+        to resumable processes as the `checkpoint` argument.
+    """
+    def __init__(self, state):
+        self.state = state
 
 
 class Output:
@@ -74,6 +200,16 @@ class Output:
         self.data = data
 
 
+def to_bytes(data):
+    """ Convert an output value to bytes for storage.
+    """
+    if isinstance(data, bytes):
+        return data
+    elif isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    return str(data).encode('utf-8')
+
+
 # def _get_job():
 #     frame = currentframe()
 #     while frame:
@@ -104,9 +104,9 @@ class Output:
     def from_node(cls, node):
         return cls(
             identifier=node.attrib['id'],
-            transmission=node.attrib.get(
+            transmission=node.attrib.get('transmission', node.attrib.get(
                 f"{{{nsmap['wps']}}}dataTransmissionMode"
-            ),
+            )),
             mimetype=node.attrib.get('mimetype'),
             schema=node.attrib.get('schema'),
             encoding=node.attrib.get('encoding'),
@@ -121,8 +121,17 @@ class ExecuteRequest(Request):
     response: str = "document"
     mode: str = "async"
 
+    # optional resource limits, further restricting the processes defaults
+    timeout: float = None
+    cpu_time: float = None
+    memory_limit: int = None
+
     @classmethod
     def from_node(cls, root):
+        def optional(name, type_):
+            value = root.attrib.get(name)
+            return type_(value) if value is not None else None
+
         return cls(
             identifier=str(
                 root.xpath('ows:Identifier/text()', namespaces=nsmap)[0].strip()
@@ -137,6 +146,9 @@ class ExecuteRequest(Request):
             ],
             response=root.attrib["response"],
             mode=root.attrib["mode"],
+            timeout=optional("timeout", float),
+            cpu_time=optional("cpuTime", float),
+            memory_limit=optional("memoryLimit", int),
         )
 
     @classmethod
@@ -156,16 +168,72 @@ class JobRelatedRequestMixIn:
         return cls(job_id=kvp['jobid'])
 
 
+def parse_duration(value):
+    """ Parse a duration in seconds, optionally suffixed with `s`.
+    """
+    if value is None:
+        return None
+    value = value.strip().lower()
+    return float(value[:-1] if value.endswith('s') else value)
+
+
 @dataclass(frozen=True)
 class GetStatusRequest(JobRelatedRequestMixIn, Request):
     request: ClassVar = "GetStatus"
     job_id: str
+    # all requested jobs, when the status of several jobs is requested at once
+    job_ids: Tuple[str, ...] = ()
+    # wait up to this many seconds for the status or progress to differ from
+    # the last known ones, before responding
+    wait_for: float = None
+    last_status: str = None
+    last_percent_completed: int = None
+
+    @classmethod
+    def from_attributes(cls, job_ids, attributes):
+        percent = attributes.get('lastPercentCompleted')
+        return cls(
+            job_id=job_ids[0],
+            job_ids=tuple(job_ids),
+            wait_for=parse_duration(attributes.get('waitFor')),
+            last_status=attributes.get('lastStatus'),
+            last_percent_completed=int(percent) if percent is not None else None,
+        )
+
+    @classmethod
+    def from_node(cls, root):
+        return cls.from_attributes([
+            str(job_id).strip()
+            for job_id in root.xpath('wps:JobID/text()', namespaces=nsmap)
+        ], root.attrib)
+
+    @classmethod
+    def from_kvp(cls, kvp):
+        return cls.from_attributes([
+            job_id.strip() for job_id in kvp['jobid'].split(',') if job_id.strip()
+        ], kvp)
 
 
 @dataclass(frozen=True)
 class GetResultRequest(JobRelatedRequestMixIn, Request):
     request: ClassVar = "GetResult"
     job_id: str
+    # also return the outputs written so far by a running job
+    partial: bool = False
+
+    @classmethod
+    def from_node(cls, root):
+        return cls(
+            job_id=str(root.xpath('wps:JobID/text()', namespaces=nsmap)[0]),
+            partial=root.attrib.get('partial', 'false').lower() == 'true',
+        )
+
+    @classmethod
+    def from_kvp(cls, kvp):
+        return cls(
+            job_id=kvp['jobid'],
+            partial=kvp.get('partial', 'false').lower() == 'true',
+        )
 
 
 @dataclass(frozen=True)
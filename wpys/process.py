@@ -1,7 +1,11 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, is_dataclass
 from functools import wraps, partial
+import hashlib
+import json
 from typing import List, Tuple, Callable, Union, Any, ClassVar
-from inspect import signature, Signature, Parameter, isgeneratorfunction, currentframe
+from inspect import (
+    signature, Signature, Parameter, isgeneratorfunction, isasyncgenfunction, currentframe
+)
 from types import GeneratorType
 
 from weakref import proxy
@@ -12,12 +16,38 @@ from collections.abc import Iterable
 from pprint import pprint
 from uuid import uuid4
 
+from .job import ResourceLimits, JobOutputReference
+
 __all__ = ['process']
 
+# name of the argument the stored checkpoint is passed as to resumable processes
+CHECKPOINT_PARAMETER = 'checkpoint'
+
 
 def process(fn=None, *, identifier=None, inputs=None, outputs=None, allow_async=None,
-            allow_sync=None, metadata=None):
+            allow_sync=None, metadata=None, resumable=False, timeout=None,
+            cpu_time=None, memory_limit=None, max_concurrency=None,
+            cacheable=False, version=None, batch_size=None, batch_wait_ms=0):
     """ Decorator to dynamically a process class from a function definition.
+
+        Generator processes marked as `resumable` receive the state of the
+        last yielded `Checkpoint` as the `checkpoint` argument when the job
+        is resumed after a pause (and `None` on the initial run).
+
+        `timeout`, `cpu_time` (both in seconds) and `memory_limit` (in bytes)
+        are the default resource limits of the processes jobs.
+
+        `max_concurrency` caps the number of jobs of this process running at
+        the same time across all workers.
+
+        The results of `cacheable` processes are reused for requests with the
+        same inputs and outputs. The `version` has to be changed whenever the
+        process would produce different results.
+
+        A process with a `batch_size` is called with up to that many queued
+        jobs at once, waiting `batch_wait_ms` milliseconds for them: each
+        argument is a list of the values of all jobs, and a sequence with one
+        result (or exception) per job has to be returned.
     """
     if fn is None:
         return partial(
@@ -26,15 +56,32 @@ def process(fn=None, *, identifier=None, inputs=None, outputs=None, allow_async=
             inputs=inputs,
             outputs=outputs,
             allow_async=allow_async,
-            allow_sync=allow_sync
+            allow_sync=allow_sync,
+            metadata=metadata,
+            resumable=resumable,
+            timeout=timeout,
+            cpu_time=cpu_time,
+            memory_limit=memory_limit,
+            max_concurrency=max_concurrency,
+            cacheable=cacheable,
+            version=version,
+            batch_size=batch_size,
+            batch_wait_ms=batch_wait_ms,
         )
 
+    if batch_size and (isgeneratorfunction(fn) or isasyncgenfunction(fn)):
+        raise Exception('Batched processes cannot be generators.')
+
     sig = signature(fn)
+    parameters = [
+        param for param in sig.parameters.values()
+        if not (resumable and param.name == CHECKPOINT_PARAMETER)
+    ]
 
     # build input definition if not already passed
     if not inputs:
         inputs = []
-        for param in sig.parameters.values():
+        for param in parameters:
             # try to find a suitable default literal value definition
             default = DEFAULT_LITERAL_DATA.get(param.annotation) or DEFAULT_LITERAL_DATA[None]
             inputs.append(default(identifier=param.name))
@@ -44,7 +91,7 @@ def process(fn=None, *, identifier=None, inputs=None, outputs=None, allow_async=
     else:
         # some checking
         # TODO: expand?
-        if not len(inputs) == len(sig.parameters):
+        if not len(inputs) == len(parameters):
             raise Exception('Invalid number of inputs specified.')
 
     if not outputs:
@@ -96,7 +143,16 @@ def process(fn=None, *, identifier=None, inputs=None, outputs=None, allow_async=
         outputs=outputs,
         allow_async=allow_async,
         allow_sync=allow_sync,
-        metadata=metadata
+        metadata=metadata,
+        resumable=resumable,
+        limits=ResourceLimits(
+            timeout=timeout, cpu_time=cpu_time, memory=memory_limit
+        ),
+        max_concurrency=max_concurrency,
+        cacheable=cacheable,
+        version=version,
+        batch_size=batch_size,
+        batch_wait_ms=batch_wait_ms,
     )
 
     fn.__process_wrapper__ = wrapper
@@ -191,30 +247,25 @@ def parse_bool(value):
     else:
         raise ValueError(f"Invalid boolean value '{value}'")
 
+def _literal_data(data_type, value_parser=None):
+    """ Get a factory of literal data definitions. Each definition gets its
+        own formats and domains, as the default value is set on the domain.
+    """
+    def create(identifier):
+        return LiteralData(
+            identifier=identifier,
+            value_parser=value_parser,
+            formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
+            domains=[Domain(data_type=data_type)],
+        )
+    return create
+
 DEFAULT_LITERAL_DATA = {
-    str: partial(LiteralData,
-        formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
-        domains=[Domain(data_type='http://www.w3.org/2001/XMLSchema#string')],
-    ),
-    int: partial(LiteralData,
-        value_parser=int,
-        formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
-        domains=[Domain(data_type='http://www.w3.org/2001/XMLSchema#integer')],
-    ),
-    float: partial(LiteralData,
-        value_parser=float,
-        formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
-        domains=[Domain(data_type='http://www.w3.org/2001/XMLSchema#double')],
-    ),
-    bool: partial(LiteralData,
-        value_parser=parse_bool,
-        formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
-        domains=[Domain(data_type='http://www.w3.org/2001/XMLSchema#boolean')],
-    ),
-    None: partial(LiteralData,
-        formats=[Format(mimetype='text/plain'), Format(mimetype='text/xml')],
-        domains=[Domain(data_type='http://www.w3.org/2001/XMLSchema#string')],
-    ),
+    str: _literal_data('http://www.w3.org/2001/XMLSchema#string'),
+    int: _literal_data('http://www.w3.org/2001/XMLSchema#integer', int),
+    float: _literal_data('http://www.w3.org/2001/XMLSchema#double', float),
+    bool: _literal_data('http://www.w3.org/2001/XMLSchema#boolean', parse_bool),
+    None: _literal_data('http://www.w3.org/2001/XMLSchema#string'),
 }
 
 
@@ -227,8 +278,17 @@ class ProcessWrapper:
     allow_async: bool
     allow_sync: bool
     metadata: Metadata
-
-    def __init__(self, fn, identifier, inputs, outputs, allow_async, allow_sync, metadata=None):
+    resumable: bool
+    limits: ResourceLimits
+    max_concurrency: int
+    cacheable: bool
+    version: str
+    batch_size: int
+    batch_wait_ms: float
+
+    def __init__(self, fn, identifier, inputs, outputs, allow_async, allow_sync, metadata=None,
+                 resumable=False, limits=None, max_concurrency=None, cacheable=False,
+                 version=None, batch_size=None, batch_wait_ms=0):
         self.fn = fn
         self.identifier = identifier
         self.inputs = inputs
@@ -236,9 +296,84 @@ class ProcessWrapper:
         self.allow_async = allow_async
         self.allow_sync = allow_sync
         self.metadata = metadata
+        self.resumable = resumable
+        self.limits = limits or ResourceLimits()
+        self.max_concurrency = max_concurrency
+        self.cacheable = cacheable
+        self.version = version
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
 
         self.__call__ = fn
 
+    @property
+    def pausable(self):
+        """ Only generator processes can be suspended at a yield point.
+        """
+        return isgeneratorfunction(self.fn) or isasyncgenfunction(self.fn)
+
+    def get_cache_key(self, inputs, outputs):
+        """ Get a hash of the parsed inputs and the requested outputs. Equal
+            requests to the same version of the process share the same key.
+        """
+        canonical = json.dumps([
+            self.identifier,
+            self.version,
+            list(inputs),
+            [
+                asdict(output) if is_dataclass(output) else output
+                for output in outputs
+            ],
+        ], sort_keys=True, default=repr)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def parse_inputs(self, inputs, references=None):
+        """ Parse all inputs of a request to a list of values in the order of
+            the process inputs, using the default values for missing ones.
+            Inputs in `references` are outputs of other jobs and kept as
+            `JobOutputReference` until these are resolved.
+        """
+        references = references or {}
+        values = {
+            input_.identifier: references.get(input_.identifier) or self.parse_input(input_)
+            for input_ in inputs
+        }
+        # the defaults of the function, including `None` defaults
+        defaults = {
+            param.name: param.default
+            for param in signature(self.fn).parameters.values()
+            if param.default is not Parameter.empty
+        }
+        parsed = []
+        for input_def in self.inputs:
+            if input_def.identifier in values:
+                parsed.append(values[input_def.identifier])
+                continue
+
+            domains = getattr(input_def, 'domains', None)
+            if domains and domains[0].default_value is not None:
+                parsed.append(domains[0].default_value)
+            elif input_def.identifier in defaults:
+                parsed.append(defaults[input_def.identifier])
+            else:
+                raise Exception(f"Missing input {input_def.identifier}")
+        return parsed
+
+    def parse_job_output(self, reference: JobOutputReference, data: bytes):
+        """ Parse the output of another job, that is the value of an input.
+            Literal inputs are parsed from its text, others get its bytes.
+        """
+        input_def = next(
+            input_def for input_def in self.inputs
+            if input_def.identifier == reference.input_id
+        )
+        if isinstance(input_def, LiteralData):
+            # the text is the value, without any `@` arguments
+            value = data.decode('utf-8')
+            value_parser = input_def.formats[0].value_parser or input_def.value_parser
+            return value_parser(value) if value_parser else value
+        return data
+
     def parse_input(self, input_):
         identifier = input_.identifier
         for input_def in self.inputs:
@@ -258,7 +393,7 @@ class ProcessWrapper:
             )
             return value, args
 
-        if isinstance(input_def, LiteralData):
+        if isinstance(input_def, LiteralData) and data is not None:
             raw_value, args = parse_literal_data(data.data)
             if data.mimetype:
                 for format_ in input_def.formats:
@@ -291,12 +426,10 @@ class ProcessWrapper:
             
             return value
 
-        elif isinstance(input_def, BoundingBoxData):
-            # TODO: implement
-            raise NotImplementedError
-        elif isinstance(input_def, ComplexData):
-            # TODO: implement
-            raise NotImplementedError
+
+        # TODO: parse bounding boxes, complex data and references, until
+        # then the process gets the request input as it is
+        return input_
 
 
 # @process
@@ -0,0 +1,164 @@
+import asyncio
+
+from .exceptions import NoSuchResult
+
+# serve the whole result instead of answering excessive range requests
+MAX_RANGES = 64
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def parse_range_header(value, size):
+    """ Parse a `Range` header to a list of `(start, end)` tuples with an
+        exclusive end. Returns `None` when the header cannot be parsed, and
+        raises `UnsatisfiableRange` when no range overlaps the result.
+    """
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        first, sep, last = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                # suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size
+            else:
+                start = int(first)
+                end = int(last) + 1 if last else None
+                if end is not None and end <= start:
+                    return None
+                end = size if end is None else min(end, size)
+        except ValueError:
+            return None
+
+        if start < size:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise UnsatisfiableRange(value)
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # coalesce overlapping ranges
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _strip_etag(etag):
+    etag = etag.strip()
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def etag_matches(header, etag):
+    """ Weak comparison of an `If-None-Match` header against an ETag.
+    """
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(_strip_etag(value) == etag for value in header.split(','))
+
+
+def if_range_matches(header, etag):
+    """ Whether a range request may be answered partially: `If-Range` is
+        absent or strongly matches the ETag. Dates are not supported.
+    """
+    if not header:
+        return True
+    header = header.strip()
+    return bool(etag) and not header.startswith('W/') and header.strip('"') == etag
+
+
+async def stream_result(raw_result, chunk_size, start=0, end=None):
+    """ Iterate over the bytes between `start` and `end` of a result.
+    """
+    try:
+        await raw_result.seek(start)
+        while end is None or raw_result.tell() < end:
+            size = chunk_size if end is None else min(chunk_size, end - raw_result.tell())
+            chunk = await raw_result.read(size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        raw_result.close()
+
+
+async def tail_result(raw_result, chunk_size, interval, timeout):
+    """ Iterate over a result that is still being written, following it
+        until it is complete, or did not grow for `timeout` seconds.
+    """
+    complete = False
+    idle = 0
+    try:
+        while True:
+            chunk = await raw_result.read(chunk_size)
+            if chunk:
+                idle = 0
+                yield chunk
+                continue
+
+            if complete or idle >= timeout:
+                break
+            # read once more after completion, to get the last written data
+            complete = await raw_result.is_complete()
+            if not complete:
+                await asyncio.sleep(interval)
+                idle += interval
+    except NoSuchResult:
+        # the partial result was discarded, e.g. because the job failed
+        pass
+    finally:
+        raw_result.close()
+
+
+def multipart_byteranges(raw_result, ranges, size, mimetype, boundary, chunk_size):
+    """ Build a `multipart/byteranges` body for multiple ranges. Returns the
+        body iterator and its length.
+    """
+    part_headers = [
+        (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        ).encode('ascii')
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode('ascii')
+    length = sum(
+        len(header) + end - start
+        for header, (start, end) in zip(part_headers, ranges)
+    ) + len(closing)
+
+    async def iterate():
+        try:
+            for header, (start, end) in zip(part_headers, ranges):
+                yield header
+                await raw_result.seek(start)
+                while raw_result.tell() < end:
+                    chunk = await raw_result.read(min(chunk_size, end - raw_result.tell()))
+                    if not chunk:
+                        break
+                    yield chunk
+            yield closing
+        finally:
+            raw_result.close()
+
+    return iterate(), length
@@ -1,17 +1,67 @@
+import hashlib
+
+import aioredis
+
+from ..exceptions import NoSuchResult
+from ..job import to_bytes
+from ..compression import Encoder, choose_encoding
+
+# hash with the stored and original size, chunk size, mimetype, encoding,
+# completion state and ETag of a result. The chunks use another prefix, so
+# that output names containing ':' cannot be mistaken for chunk keys.
+RESULT_MANIFEST_KEY_TEMPLATE = "results:%s:%s"
+RESULT_CHUNK_KEY_TEMPLATE = "result_chunks:%s:%s:%d"
 
 
 class RedisResult:
-    def __init__(self, redis, key):
+    """ File-like reader of a result stored in chunks. Only the chunks
+        covering the requested range are fetched, and reads end at chunk
+        boundaries where possible, so that the next read starts at a chunk.
+        The manifest is read once the result is complete.
+    """
+    def __init__(self, redis, job_id, output_name, mimetype=None, encoding=None):
         self.redis = redis
-        self.key = key
+        self.job_id = job_id
+        self.output_name = output_name
+        self.mimetype = mimetype
+        self.encoding = encoding
         self._closed = False
         self._offset = 0
+        self._complete_manifest = None
+
+    async def _manifest(self):
+        if self._complete_manifest is not None:
+            return self._complete_manifest
+        manifest = await self.redis.hgetall(
+            RESULT_MANIFEST_KEY_TEMPLATE % (self.job_id, self.output_name)
+        )
+        if not manifest:
+            raise NoSuchResult(f"No result {self.output_name} for job {self.job_id}")
+        if manifest.get(b'complete') == b'1':
+            # a complete result does not change anymore
+            self._complete_manifest = manifest
+        return manifest
 
     async def read(self, size=None):
-        if size is None and self._offset == 0:
-            data = await self.redis.get(self.key)
-        else:
-            data = await self.redis.getrange(self._offset, size)
+        manifest = await self._manifest()
+        total, chunk_size = int(manifest[b'size']), int(manifest[b'chunk_size'])
+        end = total if size is None else min(self._offset + size, total)
+        if self._offset >= end:
+            return b''
+        aligned_end = end // chunk_size * chunk_size
+        if aligned_end > self._offset:
+            end = aligned_end
+
+        first = self._offset // chunk_size
+        last = (end - 1) // chunk_size
+        chunks = await self.redis.mget(*[
+            RESULT_CHUNK_KEY_TEMPLATE % (self.job_id, self.output_name, index)
+            for index in range(first, last + 1)
+        ])
+        start = first * chunk_size
+        data = b''.join(chunk or b'' for chunk in chunks)[
+            self._offset - start:end - start
+        ]
         self._offset += len(data)
         return data
 
@@ -23,16 +73,192 @@ class RedisResult:
         elif from_what == 2:
             self._offset = await self.size() + offset
 
+    def tell(self):
+        return self._offset
+
     async def size(self):
-        return await self.redis.strlen(self.key)
+        """ The size of the stored, possibly compressed data.
+        """
+        return int((await self._manifest())[b'size'])
+
+    async def original_size(self):
+        """ The size of the uncompressed data.
+        """
+        return int((await self._manifest())[b'original_size'])
+
+    async def is_complete(self):
+        return (await self._manifest()).get(b'complete') == b'1'
+
+    async def etag(self):
+        """ Content hash of the completed result.
+        """
+        etag = (await self._manifest()).get(b'etag')
+        return etag.decode('utf-8') if etag else None
+
+    def close(self):
+        self._closed = True
+
+
+class RedisResultWriter:
+    """ Appends to a result stored in chunks of a fixed size. Readers can
+        access the data written so far.
+    """
+    tier = "redis"
+
+    def __init__(self, redis, job_id, output_name, chunk_size, expiration_time=None,
+                 encoding=None, sync_flush=False):
+        self.redis = redis
+        self.job_id = job_id
+        self.output_name = output_name
+        self.chunk_size = chunk_size
+        self.expiration_time = expiration_time
+        self.size = 0
+        self.original_size = 0
+        self._hash = hashlib.sha256()
+        self._encoder = Encoder(encoding, sync_flush)
+
+    async def write(self, data):
+        data = to_bytes(data)
+        self._hash.update(data)
+        self.original_size += len(data)
+        await self._append(self._encoder.encode(data))
+
+    async def _append(self, data, **fields):
+        data = memoryview(data)
+        transaction = self.redis.multi_exec()
+        while data:
+            index, offset = divmod(self.size, self.chunk_size)
+            part = data[:self.chunk_size - offset]
+            key = RESULT_CHUNK_KEY_TEMPLATE % (self.job_id, self.output_name, index)
+            transaction.append(key, bytes(part))
+            if self.expiration_time is not None:
+                transaction.expire(key, self.expiration_time)
+            self.size += len(part)
+            data = data[len(part):]
+
+        # the size is only increased together with the data
+        manifest_key = RESULT_MANIFEST_KEY_TEMPLATE % (self.job_id, self.output_name)
+        transaction.hmset_dict(
+            manifest_key,
+            size=self.size, original_size=self.original_size, **fields
+        )
+        if self.expiration_time is not None:
+            # expire the manifest together with the last written chunk
+            transaction.expire(manifest_key, self.expiration_time)
+        await transaction.execute()
+
+    async def close(self):
+        await self._append(
+            self._encoder.finish(), complete=1, etag=self._hash.hexdigest()
+        )
+        if self.expiration_time is not None:
+            # the chunks written first expire together with the last one
+            transaction = self.redis.multi_exec()
+            for index in range(-(-self.size // self.chunk_size)):
+                transaction.expire(
+                    RESULT_CHUNK_KEY_TEMPLATE % (self.job_id, self.output_name, index),
+                    self.expiration_time,
+                )
+            await transaction.execute()
 
 
 class RedisResultBackend:
-    def __init__(self, redis):
-        pass
+    """ Stores each result as a manifest and a sequence of chunk keys of
+        `result_chunk_size` bytes.
+    """
+    def __init__(self, redis, config):
+        self.redis = redis
+        self.config = config
+
+    async def open_job_result(self, job_id, output_name, mimetype=None,
+                              size=None) -> RedisResultWriter:
+        """ Create a new, empty result and return a writer to append to it.
+            The result is compressed depending on its mimetype and expected
+            size.
+        """
+        encoding = choose_encoding(self.config, mimetype, size)
+        await self.delete_job_result(job_id, output_name)
+        manifest_key = RESULT_MANIFEST_KEY_TEMPLATE % (job_id, output_name)
+        await self.redis.hmset_dict(manifest_key, {
+            'size': 0,
+            'original_size': 0,
+            'chunk_size': self.config.result_chunk_size,
+            'mimetype': mimetype or '',
+            'encoding': encoding or '',
+            'complete': 0,
+        })
+        if self.config.expiration_time is not None:
+            await self.redis.expire(manifest_key, self.config.expiration_time)
+
+        return RedisResultWriter(
+            self.redis, job_id, output_name, self.config.result_chunk_size,
+            self.config.expiration_time, encoding,
+            # outputs of unknown size are written incrementally and read
+            # while being written
+            sync_flush=size is None,
+        )
+
+    async def put_job_result(self, job_id, output_name, result, mimetype=None):
+        result = to_bytes(result)
+        writer = await self.open_job_result(job_id, output_name, mimetype, len(result))
+        await writer.write(result)
+        await writer.close()
+
+    async def get_job_result(self, job_id, output_name) -> RedisResult:
+        mimetype, encoding = await self.redis.hmget(
+            RESULT_MANIFEST_KEY_TEMPLATE % (job_id, output_name),
+            'mimetype', 'encoding'
+        )
+        if mimetype is None:
+            raise NoSuchResult(f"No result {output_name} for job {job_id}")
+        return RedisResult(
+            self.redis, job_id, output_name, mimetype.decode('utf-8') or None,
+            (encoding.decode('utf-8') or None) if encoding else None
+        )
+
+    async def delete_job_result(self, job_id, output_name):
+        manifest_key = RESULT_MANIFEST_KEY_TEMPLATE % (job_id, output_name)
+        manifest = await self.redis.hgetall(manifest_key)
+        if not manifest:
+            return
+
+        size, chunk_size = int(manifest[b'size']), int(manifest[b'chunk_size'])
+        await self.redis.delete(manifest_key, *[
+            RESULT_CHUNK_KEY_TEMPLATE % (job_id, output_name, index)
+            for index in range(-(-size // chunk_size))
+        ])
+
+    async def delete_job_results(self, job_id):
+        """ Delete all results of the job, also those not recorded with it.
+        """
+        output_names = [
+            key.decode('utf-8').split(':', 2)[2]
+            async for key in self.redis.iscan(
+                match=RESULT_MANIFEST_KEY_TEMPLATE % (job_id, '*'),
+                count=self.config.retention_sweep_batch_size)
+        ]
+        for output_name in output_names:
+            await self.delete_job_result(job_id, output_name)
+
+    async def iter_job_results(self):
+        """ Iterate over the job IDs and output names of all stored results.
+            Keys are iterated with SCAN, without blocking Redis.
+        """
+        async for key in self.redis.iscan(
+                match=RESULT_MANIFEST_KEY_TEMPLATE % ('*', '*'),
+                count=self.config.retention_sweep_batch_size):
+            # job IDs contain no ':', output names may
+            _, job_id, output_name = key.decode('utf-8').split(':', 2)
+            yield job_id, output_name
 
-    async def put_job_result(self, job, output_name, result):
-        pass
+    async def close(self):
+        self.redis.close()
+        await self.redis.wait_closed()
 
-    async def get_job_result(self, job, output_name):
-        pass
+    @classmethod
+    async def get_backend(cls, config, loop=None):
+        redis = await aioredis.create_redis_pool(
+            config.result_backend_options.get('address', ('localhost', 6379)),
+            loop=loop,
+        )
+        return cls(redis, config)
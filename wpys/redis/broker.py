@@ -1,14 +1,144 @@
 from uuid import uuid4
 import pickle
 from collections.abc import Iterable
+from typing import List
 import asyncio
+import time
+import logging
 import aioredis
 
-from ..job import Job, JobException, JobStatus
+from ..job import Job, JobException, JobStatus, FINAL_STATUSES
+
+logger = logging.getLogger(__name__)
 
 JOBS_KEY_TEMPLATE = "jobs:%s"
 EXECUTION_QUEUE_KEY = "execute_queue"
 JOB_CONTROL_CHANNEL_TEMPLATE = "control:%s"
+# receives the status and progress of a job, whenever the job is updated
+JOB_STATUS_CHANNEL_TEMPLATE = "status:%s"
+PROCESS_SEMAPHORE_KEY_TEMPLATE = "semaphore:%s"
+CACHE_KEY_TEMPLATE = "cache:%s"
+# additional queue per batched process, from which jobs are claimed
+BATCH_QUEUE_KEY_TEMPLATE = "batch_queue:%s"
+# interval in seconds of checking for further jobs of a batch
+BATCH_POLL_INTERVAL = 0.01
+# sorted set of cache keys, scored by the time of their last use
+CACHE_INDEX_KEY = "cache_index"
+# sorted sets of completed jobs, scored by the size of their outputs and by
+# the time of their last access, and the total size of all outputs
+JOB_SIZES_KEY = "job_sizes"
+JOB_ACCESS_KEY = "job_access"
+STORED_SIZE_KEY = "stored_size"
+RETENTION_LOCK_KEY = "retention_lock"
+# sorted sets of the queued and running jobs per process. Running jobs are
+# scored by the expiry of their lease, so that jobs of crashed workers drop
+# out, queued jobs do not expire.
+INFLIGHT_KEY_TEMPLATE = "inflight:%s"
+# moving average of the duration of jobs
+JOB_DURATION_KEY = "job_duration"
+# sorted set of worker IDs, scored by the expiry of their heartbeat
+WORKERS_KEY = "workers"
+RATE_LIMIT_KEY_TEMPLATE = "rate_limit:%s"
+# marks dismissed jobs, until workers that just picked them noticed
+DISMISSED_KEY_TEMPLATE = "dismissed:%s"
+DISMISSED_TIME = 600
+# marks running jobs that shall be paused, until they stopped running
+PAUSE_REQUESTED_KEY_TEMPLATE = "pause_requested:%s"
+# jobs held until the job succeeded, and jobs the held job still waits for
+DEPENDENTS_KEY_TEMPLATE = "dependents:%s"
+PENDING_DEPENDENCIES_KEY_TEMPLATE = "pending_dependencies:%s"
+# jobs preferably run by a worker, taken before the execution queue
+WORKER_QUEUE_KEY_TEMPLATE = "worker_queue:%s"
+# patterns of the channels of all jobs
+JOB_CHANNEL_PATTERNS = (
+    JOB_CONTROL_CHANNEL_TEMPLATE % '*', JOB_STATUS_CHANNEL_TEMPLATE % '*'
+)
+# delays between attempts to subscribe again after losing the connection
+SUBSCRIBE_MIN_RETRY_DELAY = 0.5
+SUBSCRIBE_MAX_RETRY_DELAY = 30
+
+# Counting semaphore: a sorted set of job IDs scored by the expiry of their
+# lease. Expired leases are dropped before counting the taken slots.
+# KEYS: semaphore key; ARGV: now, lease expiry, limit, job ID
+ACQUIRE_SEMAPHORE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4])
+        or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    return 1
+end
+return 0
+"""
+
+# KEYS: job sizes, job access, stored size; ARGV: job ID, size, now
+TRACK_JOB_SCRIPT = """
+local old = redis.call('ZSCORE', KEYS[1], ARGV[1]) or 0
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return redis.call('INCRBY', KEYS[3], ARGV[2] - old)
+"""
+
+# KEYS: job sizes, job access, stored size; ARGV: job ID
+FORGET_JOB_SCRIPT = """
+local size = redis.call('ZSCORE', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+if size then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('DECRBY', KEYS[3], size)
+end
+"""
+
+# KEYS: job duration; ARGV: duration, weight of the new sample
+UPDATE_DURATION_SCRIPT = """
+local average = tonumber(redis.call('GET', KEYS[1]))
+local duration = tonumber(ARGV[1])
+if average then
+    duration = average + tonumber(ARGV[2]) * (duration - average)
+end
+redis.call('SET', KEYS[1], tostring(duration))
+"""
+
+# Token bucket, returns the time to wait for the next token, 0 if one was
+# taken. KEYS: bucket; ARGV: now, rate, burst
+TAKE_TOKEN_SCRIPT = """
+local now, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or burst
+local last = tonumber(redis.call('HGET', KEYS[1], 'last')) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'last', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# Mark a job as dismissed and take it out of the queues. Returns whether it
+# was still queued. KEYS: execution queue, batch queue, tombstone, queue the
+# job was put into; ARGV: job ID, tombstone expiry
+DISMISS_JOB_SCRIPT = """
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+local removed = redis.call('LREM', KEYS[1], 0, ARGV[1])
+if KEYS[4] ~= KEYS[1] then
+    removed = removed + redis.call('LREM', KEYS[4], 0, ARGV[1])
+end
+redis.call('LREM', KEYS[2], 0, ARGV[1])
+return removed
+"""
+
+# Mark a job the held job waited for as done. Returns 1 to exactly one
+# caller, once the held job does not wait for any other job.
+# KEYS: pending dependencies; ARGV: job ID of the dependency
+RELEASE_DEPENDENCY_SCRIPT = """
+if redis.call('SREM', KEYS[1], ARGV[1]) == 1
+        and redis.call('SCARD', KEYS[1]) == 0 then
+    return 1
+end
+return 0
+"""
 
 
 class RedisBroker:
@@ -18,7 +148,22 @@ class RedisBroker:
         self.redis = redis
         self.config = config
 
-    async def create_job(self, job_id, process, inputs, outputs) -> Job:
+        # subscribed channels are fanned out to the local watchers
+        self.subscriber = None
+        self.watchers = {}
+        # called with the job ID of each status message, or `None` when
+        # messages may have been missed
+        self.status_listeners = []
+        self._subscribe_lock = asyncio.Lock()
+        self._dispatcher = None
+        # whether all job channels are subscribed by pattern, rather than
+        # only the watched ones
+        self._patterns = False
+        # tasks forwarding the messages of each subscribed channel or pattern
+        self._forwarders = {}
+
+    async def create_job(self, job_id, process, inputs, outputs, limits=None,
+                         cache_key=None, dependencies=()) -> Job:
         """ Create a new Job and persist it in the redis store.
         """
         job = Job(
@@ -27,6 +172,9 @@ class RedisBroker:
             inputs=inputs,
             outputs=outputs,
             results=[],
+            limits=limits,
+            cache_key=cache_key,
+            dependencies=dependencies,
         )
 
         # check if an old job with that ID already existed. if yes, 
@@ -49,24 +197,264 @@ class RedisBroker:
             return None
         return pickle.loads(data)
 
-    async def enqueue_job(self, job_id):
+    async def get_jobs(self, job_ids) -> List[Job]:
+        """ Get several jobs with a single request. Jobs that do not exist
+            are returned as `None`.
+        """
+        if not job_ids:
+            return []
+        encoded = await self.redis.mget(*[
+            JOBS_KEY_TEMPLATE % job_id for job_id in job_ids
+        ])
+        return [pickle.loads(data) if data else None for data in encoded]
+
+    async def enqueue_job(self, job_id, worker_id=None):
         """ Schedule a job for execution, by putting the job ID into the
-            execution queue.
+            execution queue. With `worker_id`, the job is preferably run by
+            that worker, as long as it is alive.
+        """
+        job = await self.get_job(job_id)
+        await self.redis.zadd(
+            INFLIGHT_KEY_TEMPLATE % job.process.identifier, float('inf'), job_id
+        )
+        if job.process.batch_size:
+            await self.redis.lpush(
+                BATCH_QUEUE_KEY_TEMPLATE % job.process.identifier, job_id
+            )
+        queue_key = EXECUTION_QUEUE_KEY
+        if worker_id is not None and await self.is_worker_alive(worker_id):
+            queue_key = WORKER_QUEUE_KEY_TEMPLATE % worker_id
+        if job.queue != queue_key:
+            # so that the job can be taken out of that queue again
+            job.queue = queue_key
+            await self.update_job(job)
+        await self.redis.lpush(queue_key, job_id)
+
+    async def submit_job(self, job):
+        """ Enqueue a new job, or hold it until all jobs whose outputs it
+            takes as inputs succeeded.
+        """
+        if not job.dependencies:
+            await self.enqueue_job(job.identifier)
+            return
+
+        pending_key = PENDING_DEPENDENCIES_KEY_TEMPLATE % job.identifier
+        await self.redis.sadd(pending_key, *job.dependencies)
+        await self._expire(pending_key)
+        for dependency_id in job.dependencies:
+            dependents_key = DEPENDENTS_KEY_TEMPLATE % dependency_id
+            await self.redis.sadd(dependents_key, job.identifier)
+            await self._expire(dependents_key)
+
+        # the jobs could have completed before the held job was registered
+        dependencies = await self.get_jobs(job.dependencies)
+        for dependency_id, dependency in zip(job.dependencies, dependencies):
+            if dependency is None:
+                await self._fail_held_job(
+                    job.identifier, f"Job {dependency_id} does not exist"
+                )
+            elif dependency.status == JobStatus.SUCCEEDED:
+                await self._release_dependency(dependency, job.identifier)
+            elif dependency.status in FINAL_STATUSES:
+                await self.fail_dependent_jobs(dependency)
+
+    async def release_dependent_jobs(self, job):
+        """ Enqueue the jobs held for the succeeded job, that do not wait for
+            other jobs. They are preferably run by the worker that ran the
+            job, which still has its outputs at hand.
+        """
+        for dependent_id in await self._pop_dependents(job.identifier):
+            await self._release_dependency(job, dependent_id)
+
+    async def fail_dependent_jobs(self, job):
+        """ Fail the jobs held for the job that failed or was dismissed, and
+            in turn the jobs held for them.
+        """
+        for dependent_id in await self._pop_dependents(job.identifier):
+            await self._fail_held_job(
+                dependent_id, f"Job {job.identifier} it depends on is {job.status}"
+            )
+
+    async def _pop_dependents(self, job_id):
+        dependents_key = DEPENDENTS_KEY_TEMPLATE % job_id
+        transaction = self.redis.multi_exec()
+        dependent_ids = transaction.smembers(dependents_key)
+        transaction.delete(dependents_key)
+        await transaction.execute()
+        return [dependent_id.decode('utf-8') for dependent_id in await dependent_ids]
+
+    async def _release_dependency(self, dependency, job_id):
+        released = await self.redis.eval(
+            RELEASE_DEPENDENCY_SCRIPT,
+            keys=[PENDING_DEPENDENCIES_KEY_TEMPLATE % job_id],
+            args=[dependency.identifier],
+        )
+        if released:
+            await self.enqueue_job(job_id, dependency.worker)
+
+    async def _fail_held_job(self, job_id, message):
+        # only fail jobs that are still held, and only once
+        if not await self.redis.delete(PENDING_DEPENDENCIES_KEY_TEMPLATE % job_id):
+            return
+        job = await self.get_job(job_id, False)
+        if job is None or job.status in FINAL_STATUSES:
+            return
+        job.status = JobStatus.FAILED
+        job.exception = JobException(message)
+        await self.update_job(job)
+        await self.track_job_storage(job)
+        await self.fail_dependent_jobs(job)
+
+    async def _expire(self, key):
+        if self.config.expiration_time is not None:
+            await self.redis.expire(key, self.config.expiration_time)
+
+    async def finish_job(self, job, duration=None):
+        """ Account for a job that left the queue and stopped running, and
+            for its duration.
+        """
+        await self.redis.zrem(
+            INFLIGHT_KEY_TEMPLATE % job.process.identifier, job.identifier
+        )
+        await self.redis.delete(PAUSE_REQUESTED_KEY_TEMPLATE % job.identifier)
+        if duration is not None:
+            await self.redis.eval(
+                UPDATE_DURATION_SCRIPT, keys=[JOB_DURATION_KEY], args=[duration, 0.1]
+            )
+
+    async def get_queue_length(self):
+        return await self.redis.llen(EXECUTION_QUEUE_KEY)
+
+    async def get_inflight_count(self, process_id):
+        inflight_key = INFLIGHT_KEY_TEMPLATE % process_id
+        await self.redis.zremrangebyscore(inflight_key, max=time.time())
+        return await self.redis.zcard(inflight_key)
+
+    async def _lease_inflight(self, job):
+        """ Count a running job as inflight for the lease time, unless it is
+            finished in the meantime.
+        """
+        await self.redis.zadd(
+            INFLIGHT_KEY_TEMPLATE % job.process.identifier,
+            time.time() + self.config.concurrency_lease_time, job.identifier,
+            exist=self.redis.ZSET_IF_EXIST,
+        )
+
+    async def get_average_duration(self):
+        duration = await self.redis.get(JOB_DURATION_KEY)
+        return float(duration) if duration else None
+
+    async def register_worker(self, worker_id, ttl):
+        await self.redis.zadd(WORKERS_KEY, time.time() + ttl, worker_id)
+
+    async def is_worker_alive(self, worker_id):
+        expiry = await self.redis.zscore(WORKERS_KEY, worker_id)
+        return expiry is not None and expiry > time.time()
+
+    async def get_worker_count(self):
+        now = time.time()
+        await self.redis.zremrangebyscore(WORKERS_KEY, max=now)
+        return await self.redis.zcard(WORKERS_KEY)
+
+    async def take_rate_limit_token(self, client, rate, burst):
+        """ Take a token from the bucket of the client. Returns the time to
+            wait for the next token when the bucket is empty, otherwise 0.
         """
-        await self.get_job(job_id)
-        await self.redis.lpush(EXECUTION_QUEUE_KEY, job_id)
+        return float(await self.redis.eval(
+            TAKE_TOKEN_SCRIPT,
+            keys=[RATE_LIMIT_KEY_TEMPLATE % client],
+            args=[time.time(), rate, burst],
+        ))
 
     async def dismiss_job(self, job_id):
-        """ Send a signal to dismiss a job: schedule its interruption and cleanup
+        """ Dismiss a job: a queued job is taken out of the queue, a running
+            job is signalled to be cancelled.
         """
-        # lookup the job, set its status to dismissed and send a notification to
-        # cancel the running job
         job = await self.get_job(job_id)
+        if job.status in FINAL_STATUSES:
+            job.status = JobStatus.DISMISSED
+            await self.update_job(job)
+            return
+        if job.status == JobStatus.RUNNING and job.process.batch_size:
+            # the jobs of a batch run in a single call
+            raise JobException(
+                f"Job {job_id} cannot be dismissed while its batch is running"
+            )
+
+        removed = await self.redis.eval(
+            DISMISS_JOB_SCRIPT,
+            keys=[
+                EXECUTION_QUEUE_KEY,
+                BATCH_QUEUE_KEY_TEMPLATE % job.process.identifier,
+                DISMISSED_KEY_TEMPLATE % job_id,
+                job.queue or EXECUTION_QUEUE_KEY,
+            ],
+            args=[job_id, DISMISSED_TIME],
+        )
         job.status = JobStatus.DISMISSED
-        self.update_job(job)
+        await self.update_job(job)
+        # a held job is not queued, it is just not released anymore
+        await self.redis.delete(PENDING_DEPENDENCIES_KEY_TEMPLATE % job_id)
+        await self.fail_dependent_jobs(job)
+        if removed:
+            await self.finish_job(job)
+        else:
+            # the job is running, or was just picked by a worker, which
+            # checks for the tombstone before running it
+            await self.redis.publish(JOB_CONTROL_CHANNEL_TEMPLATE % job_id, "dismiss")
 
+    async def is_job_dismissed(self, job_id):
+        return bool(await self.redis.exists(DISMISSED_KEY_TEMPLATE % job_id))
+
+    async def is_pause_requested(self, job_id):
+        return bool(await self.redis.exists(PAUSE_REQUESTED_KEY_TEMPLATE % job_id))
+
+    async def pause_job(self, job_id):
+        """ Suspend a job: a queued job is taken out of the execution queue,
+            a running job is signalled to stop at its next yield point.
+        """
+        job = await self.get_job(job_id)
+        if not job.process.pausable:
+            raise JobException(f"Job {job_id} cannot be paused")
+        if any(result.size is None for result in job.results):
+            # the resumed job would not write the parts so far again
+            raise JobException(
+                f"Job {job_id} cannot be paused while writing outputs incrementally"
+            )
+
+        if job.status == JobStatus.ACCEPTED:
+            # when the job was not yet picked by a worker, it is simply
+            # removed from the queue
+            # the job may have been moved from a worker queue by a sweep
+            removed = await self.redis.lrem(EXECUTION_QUEUE_KEY, 0, job_id)
+            if job.queue and job.queue != EXECUTION_QUEUE_KEY:
+                removed += await self.redis.lrem(job.queue, 0, job_id)
+            if removed:
+                job.status = JobStatus.PAUSED
+                await self.update_job(job)
+                await self.finish_job(job)
+                return
+        elif job.status != JobStatus.RUNNING:
+            raise JobException(f"Job {job_id} is not running")
+
+        # also recorded, for workers that may have missed the message
+        await self.redis.set(
+            PAUSE_REQUESTED_KEY_TEMPLATE % job_id, 1, expire=DISMISSED_TIME
+        )
         channel_name = JOB_CONTROL_CHANNEL_TEMPLATE % job_id
-        await self.redis.publish_json(channel_name, ["dismiss"])
+        await self.redis.publish(channel_name, "pause")
+
+    async def resume_job(self, job_id):
+        """ Put a paused job back into the execution queue. Any worker picking
+            it up continues from the jobs last checkpoint.
+        """
+        job = await self.get_job(job_id)
+        if job.status != JobStatus.PAUSED:
+            raise JobException(f"Job {job_id} is not paused")
+
+        job.status = JobStatus.ACCEPTED
+        await self.update_job(job)
+        await self.enqueue_job(job_id)
 
     async def update_job(self, job):
         # encode the job using pickle
@@ -78,30 +466,493 @@ class RedisBroker:
                 JOBS_KEY_TEMPLATE % job.identifier,
                 self.config.expiration_time
             )
+        await self.redis.publish(
+            JOB_STATUS_CHANNEL_TEMPLATE % job.identifier,
+            f"{job.status} {job.percent_completed}"
+        )
+
+    async def get_cached_job(self, cache_key) -> Job:
+        """ Look up the succeeded job stored for the cache key. Returns `None`
+            if there is none.
+        """
+        job_id = await self.redis.get(CACHE_KEY_TEMPLATE % cache_key)
+        if not job_id:
+            return None
 
-        print(await self.get_job(job.identifier))
+        job = await self.get_job(job_id.decode('utf-8'), False)
+        if job is None or job.status != JobStatus.SUCCEEDED:
+            await self.redis.delete(CACHE_KEY_TEMPLATE % cache_key)
+            await self.redis.zrem(CACHE_INDEX_KEY, cache_key)
+            return None
+
+        # mark as recently used
+        await self.redis.zadd(CACHE_INDEX_KEY, time.time(), cache_key)
+        return job
 
-    async def pick_job(self) -> Job:
+    async def cache_job(self, job):
+        """ Store a succeeded job under its cache key and evict the least
+            recently used entries exceeding the maximum number of entries.
+            The entry does not outlive the job and its results, which expire
+            after `expiration_time`.
+        """
+        expire = self.config.cache_expiration_time or 0
+        if self.config.expiration_time is not None:
+            expire = min(expire or self.config.expiration_time, self.config.expiration_time)
+        transaction = self.redis.multi_exec()
+        transaction.set(
+            CACHE_KEY_TEMPLATE % job.cache_key, job.identifier, expire=int(expire),
+        )
+        transaction.zadd(CACHE_INDEX_KEY, time.time(), job.cache_key)
+        await transaction.execute()
+
+        excess = await self.redis.zcard(CACHE_INDEX_KEY) - self.config.cache_max_entries
+        if excess > 0:
+            cache_keys = await self.redis.zrange(CACHE_INDEX_KEY, 0, excess - 1)
+            await self.redis.delete(*[
+                CACHE_KEY_TEMPLATE % cache_key.decode('utf-8')
+                for cache_key in cache_keys
+            ])
+            await self.redis.zrem(CACHE_INDEX_KEY, *cache_keys)
+
+    async def track_job_storage(self, job):
+        """ Record the size of the outputs of a completed job, and mark it as
+            recently used. Returns the total size of all tracked outputs.
+        """
+        size = sum(result.size or 0 for result in job.results)
+        return await self.redis.eval(
+            TRACK_JOB_SCRIPT,
+            keys=[JOB_SIZES_KEY, JOB_ACCESS_KEY, STORED_SIZE_KEY],
+            args=[job.identifier, size, time.time()],
+        )
+
+    async def touch_job(self, job_id):
+        """ Mark the outputs of a completed job as recently used.
+        """
+        await self.redis.zadd(
+            JOB_ACCESS_KEY, time.time(), str(job_id),
+            exist=self.redis.ZSET_IF_EXIST,
+        )
+
+    async def get_stored_size(self):
+        return int(await self.redis.get(STORED_SIZE_KEY) or 0)
+
+    async def get_least_recently_used_jobs(self, count) -> List[str]:
+        job_ids = await self.redis.zrange(JOB_ACCESS_KEY, 0, count - 1)
+        return [job_id.decode('utf-8') for job_id in job_ids]
+
+    async def forget_job(self, job_id, delete=True):
+        """ Stop tracking the storage of a job, and delete the job itself.
+        """
+        if delete:
+            await self.redis.delete(JOBS_KEY_TEMPLATE % job_id)
+            await self.redis.publish(JOB_STATUS_CHANNEL_TEMPLATE % job_id, "deleted")
+        await self.redis.eval(
+            FORGET_JOB_SCRIPT,
+            keys=[JOB_SIZES_KEY, JOB_ACCESS_KEY, STORED_SIZE_KEY],
+            args=[job_id],
+        )
+
+    async def jobs_exist(self, job_ids) -> List[bool]:
+        return await asyncio.gather(*[
+            self.redis.exists(JOBS_KEY_TEMPLATE % job_id)
+            for job_id in job_ids
+        ])
+
+    async def acquire_retention_lock(self, timeout):
+        """ Make sure only one worker at a time runs the retention sweeps.
+        """
+        return bool(await self.redis.set(
+            RETENTION_LOCK_KEY, 1, expire=max(1, int(timeout)),
+            exist=self.redis.SET_IF_NOT_EXIST,
+        ))
+
+    async def sweep(self, batch_size):
+        """ Incrementally remove entries of jobs that no longer exist from the
+            queues, the cache index and the storage tracking. Keys are
+            iterated with SCAN and lists in slices, so that Redis is never
+            blocked for long.
+        """
+        # jobs preferred by workers that are gone are run by any worker
+        worker_queue_prefix = WORKER_QUEUE_KEY_TEMPLATE % ''
+        async for key in self.redis.iscan(
+                match=WORKER_QUEUE_KEY_TEMPLATE % '*', count=batch_size):
+            worker_id = key.decode('utf-8')[len(worker_queue_prefix):]
+            if not await self.is_worker_alive(worker_id):
+                while await self.redis.rpoplpush(key, EXECUTION_QUEUE_KEY):
+                    pass
+
+        queue_keys = [EXECUTION_QUEUE_KEY]
+        async for key in self.redis.iscan(
+                match=BATCH_QUEUE_KEY_TEMPLATE % '*', count=batch_size):
+            queue_keys.append(key.decode('utf-8'))
+
+        for queue_key in queue_keys:
+            start = 0
+            while True:
+                job_ids = await self.redis.lrange(
+                    queue_key, start, start + batch_size - 1
+                )
+                if not job_ids:
+                    break
+                removed = 0
+                for job_id, exists in zip(job_ids, await self.jobs_exist(
+                        [job_id.decode('utf-8') for job_id in job_ids])):
+                    if not exists:
+                        removed += await self.redis.lrem(queue_key, 0, job_id)
+                start += len(job_ids) - removed
+                await asyncio.sleep(0)
+
+        # jobs that expired or were evicted while queued
+        async for inflight_key in self.redis.iscan(
+                match=INFLIGHT_KEY_TEMPLATE % '*', count=batch_size):
+            job_ids = [
+                job_id.decode('utf-8') async for job_id, _
+                in self.redis.izscan(inflight_key, count=batch_size)
+            ]
+            for start in range(0, len(job_ids), batch_size):
+                batch = job_ids[start:start + batch_size]
+                stale = [
+                    job_id for job_id, job in zip(batch, await self.get_jobs(batch))
+                    if job is None or job.status in FINAL_STATUSES
+                ]
+                if stale:
+                    await self.redis.zrem(inflight_key, *stale)
+
+        stale = []
+        async for cache_key, _ in self.redis.izscan(CACHE_INDEX_KEY, count=batch_size):
+            if not await self.redis.exists(CACHE_KEY_TEMPLATE % cache_key.decode('utf-8')):
+                stale.append(cache_key)
+        if stale:
+            await self.redis.zrem(CACHE_INDEX_KEY, *stale)
+
+        stale = []
+        async for job_id, _ in self.redis.izscan(JOB_SIZES_KEY, count=batch_size):
+            if not await self.redis.exists(JOBS_KEY_TEMPLATE % job_id.decode('utf-8')):
+                stale.append(job_id.decode('utf-8'))
+        for job_id in stale:
+            await self.forget_job(job_id, delete=False)
+
+    async def pick_job(self, worker_id=None) -> Job:
         """ Wait and pop a job ID from the execution queue, and return a
-            job instance.
+            job instance. Jobs preferred by the worker `worker_id` are taken
+            first. Jobs of processes that are at their concurrency limit are
+            put back at the end of the queue.
         """
-        job_id = (await self.redis.brpop(EXECUTION_QUEUE_KEY))[1].decode('utf-8')
-        print(f"got job id {job_id}")
-        if job_id:
-            return await self.get_job(job_id)
+        queue_keys = [EXECUTION_QUEUE_KEY]
+        if worker_id is not None:
+            queue_keys.insert(0, WORKER_QUEUE_KEY_TEMPLATE % worker_id)
+        skipped = set()
+        while True:
+            queue_key, job_id = await self.redis.brpop(*queue_keys)
+            job_id = job_id.decode('utf-8')
+            logger.debug(f'Got job {job_id} from {queue_key.decode("utf-8")}')
+            if not job_id:
+                continue
+
+            job = await self.get_job(job_id, False)
+            if job is None:
+                # the job expired or was evicted while queued
+                continue
+
+            batch_queue_key = BATCH_QUEUE_KEY_TEMPLATE % job.process.identifier
+            if job.process.batch_size:
+                # claim the job, unless it was already taken as part of a batch
+                if not await self.redis.lrem(batch_queue_key, 1, job_id):
+                    continue
+
+            if job.status != JobStatus.ACCEPTED:
+                # dismissed or paused while queued, without leaving the queue
+                await self.finish_job(job)
+                continue
+
+            if await self.acquire_process_slot(job):
+                await self._lease_inflight(job)
+                return job
+
+            if job.process.batch_size:
+                await self.redis.rpush(batch_queue_key, job_id)
+            await self.redis.lpush(queue_key, job_id)
+            if job_id in skipped:
+                # went through the whole queue without finding a job to run
+                await asyncio.sleep(self.config.concurrency_retry_delay)
+                skipped.clear()
+            skipped.add(job_id)
+
+    async def pick_batch(self, process, count, wait) -> List[Job]:
+        """ Claim up to `count` further queued jobs of a batched process,
+            waiting at most `wait` seconds for them to arrive.
+        """
+        batch_queue_key = BATCH_QUEUE_KEY_TEMPLATE % process.identifier
+        deadline = time.monotonic() + wait
+        jobs = []
+        while len(jobs) < count:
+            # atomically pop the oldest job IDs
+            transaction = self.redis.multi_exec()
+            job_ids = transaction.lrange(batch_queue_key, -(count - len(jobs)), -1)
+            transaction.ltrim(batch_queue_key, 0, -(count - len(jobs)) - 1)
+            await transaction.execute()
+
+            # oldest first
+            job_ids = list(reversed(await job_ids))
+            for index, job_id in enumerate(job_ids):
+                job = await self.get_job(job_id.decode('utf-8'), False)
+                if job is None:
+                    continue
+                if job.status != JobStatus.ACCEPTED:
+                    await self.finish_job(job)
+                    continue
+                if not await self.acquire_process_slot(job):
+                    # put back all unclaimed jobs, the oldest at the tail
+                    await self.redis.rpush(
+                        batch_queue_key, *reversed(job_ids[index:])
+                    )
+                    return jobs
+                await self._lease_inflight(job)
+                jobs.append(job)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or len(jobs) >= count:
+                break
+            # poll in short steps, so that a full batch starts right away
+            await asyncio.sleep(min(remaining, BATCH_POLL_INTERVAL))
+
+        return jobs
 
-    async def get_job_notification(self, job_id, messages=None) -> str:
+    async def acquire_process_slot(self, job) -> bool:
+        """ Try to take a slot of the jobs process concurrency limit for the
+            duration of the lease time. Always succeeds for processes without
+            a limit.
+        """
+        max_concurrency = job.process.max_concurrency
+        if max_concurrency is None:
+            return True
+
+        now = time.time()
+        return bool(await self.redis.eval(
+            ACQUIRE_SEMAPHORE_SCRIPT,
+            keys=[PROCESS_SEMAPHORE_KEY_TEMPLATE % job.process.identifier],
+            args=[
+                now, now + self.config.concurrency_lease_time,
+                max_concurrency, job.identifier
+            ],
+        ))
+
+    async def renew_process_slot(self, job):
+        """ Extend the lease on the slot taken by the job, and on its count
+            as inflight job.
+        """
+        await self._lease_inflight(job)
+        if job.process.max_concurrency is None:
+            return
+
+        await self.redis.zadd(
+            PROCESS_SEMAPHORE_KEY_TEMPLATE % job.process.identifier,
+            time.time() + self.config.concurrency_lease_time, job.identifier,
+            exist=self.redis.ZSET_IF_EXIST,
+        )
+
+    async def release_process_slot(self, job):
+        if job.process.max_concurrency is None:
+            return
+
+        await self.redis.zrem(
+            PROCESS_SEMAPHORE_KEY_TEMPLATE % job.process.identifier,
+            job.identifier
+        )
+
+    async def _subscribe(self, channel_name=None):
+        """ Subscribe to a watched channel, or with `None` to the control and
+            status channels of all jobs. Servers following the status of all
+            jobs subscribe by pattern, workers only receive the messages of
+            the jobs they run. This uses a dedicated connection, as a
+            connection in subscribe mode cannot be used for other commands.
+        """
+        async with self._subscribe_lock:
+            if channel_name is None:
+                subscribed = self._patterns
+                self._patterns = True
+            else:
+                subscribed = self._patterns or channel_name in self._forwarders
+
+            if self._dispatcher is None or self._dispatcher.done():
+                await self._connect_subscriber()
+                self._dispatcher = asyncio.ensure_future(self._dispatch_messages())
+            elif subscribed or self.subscriber is None:
+                # the dispatcher subscribes again once reconnected
+                return
+            elif channel_name is None:
+                self._forward(await self.subscriber.psubscribe(*JOB_CHANNEL_PATTERNS))
+                # the watched channels are covered by the patterns now
+                names = [name for name in self._forwarders if name not in JOB_CHANNEL_PATTERNS]
+                if names:
+                    await self.subscriber.unsubscribe(*names)
+                for name in names:
+                    del self._forwarders[name]
+            else:
+                self._forward(await self.subscriber.subscribe(channel_name))
+
+    async def _unsubscribe(self, channel_name):
+        async with self._subscribe_lock:
+            if channel_name in self.watchers or channel_name not in self._forwarders:
+                # watched again in the meantime
+                return
+            del self._forwarders[channel_name]
+            if self.subscriber is not None:
+                try:
+                    await self.subscriber.unsubscribe(channel_name)
+                except (OSError, aioredis.RedisError):
+                    # the dispatcher subscribes again to the watched channels
+                    pass
+
+    async def _connect_subscriber(self):
+        subscriber = await aioredis.create_redis(self.redis.address)
+        try:
+            if self._patterns:
+                channels = await subscriber.psubscribe(*JOB_CHANNEL_PATTERNS)
+            elif self.watchers:
+                channels = await subscriber.subscribe(*self.watchers)
+            else:
+                channels = []
+        except Exception:
+            subscriber.close()
+            raise
+        self.subscriber = subscriber
+        self._forward(channels)
+
+    def _forward(self, channels):
+        for channel in channels:
+            name = channel.name
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            self._forwarders[name] = asyncio.ensure_future(
+                self._forward_messages(channel, name)
+            )
+
+    async def _dispatch_messages(self):
+        """ Subscribe again with increasing delays whenever the connection is
+            lost, and pass `None` to all watchers and status listeners, as
+            messages may have been missed.
+        """
+        while True:
+            await self.subscriber.wait_closed()
+            logger.warning('Lost the subscription to job messages, subscribing again')
+            self.subscriber = None
+            for forwarder in self._forwarders.values():
+                forwarder.cancel()
+            self._forwarders.clear()
+            self._notify_missed(queues=False)
+
+            delay = SUBSCRIBE_MIN_RETRY_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    async with self._subscribe_lock:
+                        await self._connect_subscriber()
+                    break
+                except (OSError, aioredis.RedisError) as e:
+                    logger.warning(f'Failed to subscribe to job messages: {e}')
+                    delay = min(delay * 2, SUBSCRIBE_MAX_RETRY_DELAY)
+            # messages published until subscribing again were missed
+            self._notify_missed()
+
+    async def _forward_messages(self, channel, name):
+        """ Fan out the messages of a channel, until it is unsubscribed or
+            the connection is lost.
+        """
+        status_prefix = JOB_STATUS_CHANNEL_TEMPLATE % ''
+        async for message in channel.iter(encoding='utf-8'):
+            if channel.is_pattern:
+                channel_name, message = message
+                if isinstance(channel_name, bytes):
+                    channel_name = channel_name.decode('utf-8')
+            else:
+                channel_name = name
+            for queue in self.watchers.get(channel_name, ()):
+                queue.put_nowait(message)
+            if channel_name.startswith(status_prefix):
+                for listener in self.status_listeners:
+                    listener(channel_name[len(status_prefix):])
+
+    def _notify_missed(self, queues=True):
+        if queues:
+            for channel_queues in self.watchers.values():
+                for queue in channel_queues:
+                    queue.put_nowait(None)
+        for listener in self.status_listeners:
+            listener(None)
+
+    async def add_status_listener(self, listener):
+        """ Call `listener` with the job ID, whenever a job is updated.
+        """
+        self.status_listeners.append(listener)
+        await self._subscribe()
+
+    async def watch_channel(self, channel_name) -> asyncio.Queue:
+        """ Get a queue receiving all messages published on the channel,
+            until `unwatch_channel` is called. `None` is put into the queue
+            when messages may have been missed.
+        """
+        queue = asyncio.Queue()
+        self.watchers.setdefault(channel_name, set()).add(queue)
+        try:
+            await self._subscribe(channel_name)
+        except Exception:
+            self.unwatch_channel(channel_name, queue)
+            raise
+        return queue
+
+    def unwatch_channel(self, channel_name, queue):
+        queues = self.watchers.get(channel_name)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.watchers[channel_name]
+                if not self._patterns:
+                    asyncio.ensure_future(self._unsubscribe(channel_name))
+
+    async def watch_job_status(self, job_id) -> asyncio.Queue:
+        return await self.watch_channel(JOB_STATUS_CHANNEL_TEMPLATE % job_id)
+
+    def unwatch_job_status(self, job_id, queue):
+        self.unwatch_channel(JOB_STATUS_CHANNEL_TEMPLATE % job_id, queue)
+
+    async def watch_job_control(self, job_id) -> asyncio.Queue:
+        return await self.watch_channel(JOB_CONTROL_CHANNEL_TEMPLATE % job_id)
+
+    def unwatch_job_control(self, job_id, queue):
+        self.unwatch_channel(JOB_CONTROL_CHANNEL_TEMPLATE % job_id, queue)
+
+    async def get_job_notification(self, job_id, messages=None, queue=None) -> str:
+        """ Wait for a control message of the job. A `queue` from
+            `watch_job_control` can be passed, to also receive the messages
+            published before this call. Returns `None` when messages may have
+            been missed.
+        """
         channel_name = JOB_CONTROL_CHANNEL_TEMPLATE % job_id
-        channel = (await self.redis.subscribe(channel_name))[0]
-        async for message in channel.iter():
-            if not messages or message in messages:
-                return message                
+        if queue is None:
+            queue = await self.watch_channel(channel_name)
+        try:
+            while True:
+                message = await queue.get()
+                if message is None or not messages or message in messages:
+                    return message
+        finally:
+            self.unwatch_channel(channel_name, queue)
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        for connection in (self.redis, self.subscriber):
+            if connection is not None:
+                connection.close()
+                await connection.wait_closed()
 
     @classmethod
     async def get_broker(cls, config, loop):
-        redis = await aioredis.create_redis(
-            ('localhost', 6379),
-            #config.broker_options.get('127.0.0.1', 'localhost'),
+        # a pool, so that blocking commands get a connection of their own
+        redis = await aioredis.create_redis_pool(
+            config.broker_options.get('address', ('localhost', 6379)),
+            maxsize=config.broker_options.get('pool_size', 10),
             loop=loop,
         )
         return cls(redis, config)
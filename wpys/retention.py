@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Retention:
+    """ Keeps the stored jobs and results within the configured limits: the
+        least recently used completed jobs are evicted together with their
+        results when `retention_max_size` is exceeded, and results, queue
+        entries and bookkeeping of expired jobs are removed by incremental
+        sweeps.
+    """
+    def __init__(self, broker, backend, config):
+        self.broker = broker
+        self.backend = backend
+        self.config = config
+
+    async def evict_job(self, job_id):
+        """ Delete a job and all of its results, including outputs that were
+            discarded or not recorded with the job.
+        """
+        await self.backend.delete_job_results(job_id)
+        await self.broker.forget_job(job_id)
+
+    async def enforce_quota(self):
+        max_size = self.config.retention_max_size
+        if max_size is None:
+            return
+
+        batch_size = self.config.retention_sweep_batch_size
+        while await self.broker.get_stored_size() > max_size:
+            job_ids = await self.broker.get_least_recently_used_jobs(batch_size)
+            if not job_ids:
+                break
+            for job_id in job_ids:
+                logger.info(f"Evicting job {job_id}")
+                await self.evict_job(job_id)
+                if await self.broker.get_stored_size() <= max_size:
+                    break
+
+    async def sweep_results(self):
+        """ Delete the results of jobs that expired.
+        """
+        batch = []
+        async for job_id, output_name in self.backend.iter_job_results():
+            batch.append((job_id, output_name))
+            if len(batch) >= self.config.retention_sweep_batch_size:
+                await self._delete_orphaned_results(batch)
+                batch = []
+        await self._delete_orphaned_results(batch)
+
+    async def _delete_orphaned_results(self, results):
+        if not results:
+            return
+        job_ids = list(dict.fromkeys(job_id for job_id, _ in results))
+        exists = await self.broker.jobs_exist(job_ids)
+        for job_id, job_exists in zip(job_ids, exists):
+            if not job_exists:
+                # also removes the directories of the filesystem backend
+                await self.backend.delete_job_results(job_id)
+
+    async def sweep(self):
+        await self.enforce_quota()
+        await self.broker.sweep(self.config.retention_sweep_batch_size)
+        await self.sweep_results()
+
+    async def run(self):
+        """ Periodically run the sweeps. With several workers, only one of
+            them sweeps per interval.
+        """
+        interval = self.config.retention_sweep_interval
+        while True:
+            try:
+                if await self.broker.acquire_retention_lock(interval):
+                    await self.sweep()
+            except Exception as e:
+                logger.exception(e)
+            await asyncio.sleep(interval)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import click
+
+from .config import load_config, ConfigurationException
+
+logger = logging.getLogger('wpys.serve')
+
+# server processes exiting sooner than this after their start count as
+# failed starts. Restarts after failed starts are delayed exponentially up
+# to the maximum delay, and serving stops after too many in a row.
+MIN_UPTIME = 10
+MAX_RESTART_DELAY = 60
+MAX_FAILED_STARTS = 10
+
+
+def _create_socket(bind):
+    """ Create the listening socket shared by all server processes.
+    """
+    host, _, port = bind.rpartition(':')
+    host = host.strip('[]')
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _use_event_loop(event_loop):
+    if event_loop == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            raise ConfigurationException(
+                'The "uvloop" event loop requires the uvloop package'
+            )
+        uvloop.install()
+    elif event_loop != "asyncio":
+        raise ConfigurationException(f"Invalid event loop {event_loop}")
+
+
+def _serve(config, fd):
+    """ Entry point of a server process. Everything connected to Redis is
+        created here, in the forked process and its own event loop, when
+        the application starts serving.
+    """
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
+    from .server import create_app
+
+    # the parent handles the interrupt of the terminal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = [f"fd://{fd}"]
+    hypercorn_config.graceful_timeout = config.shutdown_timeout
+    app = create_app(config)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    shutdown = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, shutdown.set)
+    try:
+        loop.run_until_complete(
+            serve(app, hypercorn_config, shutdown_trigger=shutdown.wait)
+        )
+    finally:
+        loop.close()
+
+
+@click.command()
+@click.option('--bind', help='Address to listen on, as host:port')
+@click.option('--processes', type=int, help='Number of server processes')
+@click.option('--event-loop', type=click.Choice(['asyncio', 'uvloop']))
+def main(bind, processes, event_loop):
+    """ Run the server in several processes sharing one listening socket.
+    """
+    config = load_config()
+    if config.logging:
+        logging.config.dictConfig(config.logging)
+
+    config.server_bind = bind or config.server_bind
+    config.server_processes = processes or config.server_processes or os.cpu_count()
+    config.server_event_loop = event_loop or config.server_event_loop
+
+    # the event loop policy is inherited by the server processes
+    _use_event_loop(config.server_event_loop)
+    sock = _create_socket(config.server_bind)
+    context = multiprocessing.get_context('fork')
+    # running server processes and their start times
+    children = {}
+    # times at which to replace server processes that exited
+    restarts = []
+    failed_starts = 0
+    stopping = False
+
+    def start_child():
+        child = context.Process(target=_serve, args=(config, sock.fileno()))
+        child.start()
+        children[child] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(
+        f"Serving on {config.server_bind} with {config.server_processes} processes"
+    )
+    for _ in range(config.server_processes):
+        start_child()
+
+    # replace server processes that died, until asked to stop
+    while children or (restarts and not stopping):
+        for child, started in list(children.items()):
+            child.join(0.1)
+            if child.is_alive():
+                continue
+            del children[child]
+            if stopping:
+                continue
+
+            if time.monotonic() - started < MIN_UPTIME:
+                failed_starts += 1
+            else:
+                failed_starts = 0
+            if failed_starts > MAX_FAILED_STARTS:
+                logger.error("Server processes keep failing to start, stopping")
+                stop(None, None)
+                continue
+
+            delay = min(2 ** failed_starts - 1, MAX_RESTART_DELAY)
+            logger.warning(
+                f"Server process {child.pid} exited with {child.exitcode}, "
+                f"restarting in {delay} seconds"
+            )
+            restarts.append(time.monotonic() + delay)
+
+        now = time.monotonic()
+        for restart in [restart for restart in restarts if restart <= now]:
+            restarts.remove(restart)
+            if not stopping:
+                start_child()
+        if not children:
+            time.sleep(0.1)
+
+    sock.close()
+    if failed_starts > MAX_FAILED_STARTS:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
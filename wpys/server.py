@@ -1,46 +1,196 @@
 from datetime import datetime, timedelta
+from uuid import uuid4
 import asyncio
+import logging
 
 from quart import Quart, request
 
 from .parsing import parse_xml_request, parse_kvp_request
-from .dispatch import dispatch
-from .config import load_config
+from .dispatch import dispatch, prerender_documents
+from .config import load_config, WPySConfig
 from .registry import load_process_registry
 from .broker import get_broker
 from .backend import get_result_backend
+from .status_cache import get_status_cache
+from .compression import accepts_encoding, decode_stream
+from .events import status_events
+from .exceptions import NoSuchResult
+from .admission import get_client_key
+from .ranges import (
+    parse_range_header, etag_matches, if_range_matches, stream_result,
+    tail_result, multipart_byteranges, UnsatisfiableRange
+)
 
-app = Quart(__name__)
-config = load_config()
+logger = logging.getLogger(__name__)
 
 
-@app.route(config.main_endpoint_name, methods=['GET', 'POST'])
-async def endpoint():
-    if request.method == 'GET':
-        wps_request = parse_kvp_request(request.args)
-    elif request.method == 'POST':
-        data = bytes(await request.get_data())
-        print(type(data))
-        wps_request = parse_xml_request(data)
+def create_app(config: WPySConfig = None) -> Quart:
+    """ Create the server application. Connections are set up and documents
+        rendered before the application starts serving, not on the first
+        requests.
+    """
+    config = config or load_config()
+    app = Quart(__name__)
+    app.broker = None
+    app.result_backend = None
+    app.process_registry = None
+    app.active_requests = 0
 
-    broker = await get_broker(config, asyncio.get_event_loop())
-    process_registry = load_process_registry(config)
+    @app.before_serving
+    async def startup():
+        app.broker = await get_broker(config, asyncio.get_event_loop())
+        # fail early, when Redis is not reachable
+        await app.broker.redis.ping()
+        app.result_backend = await get_result_backend(config)
+        app.process_registry = load_process_registry(config)
+        # subscribe to the job notifications
+        await get_status_cache(app.broker, config)
+        await prerender_documents(app.process_registry, app.broker, config)
+        logger.info("Server ready")
 
-    result = await dispatch(process_registry, broker, config, wps_request)
-    return result
+    @app.after_serving
+    async def shutdown():
+        # wait for the requests still being handled
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + config.shutdown_timeout
+        while app.active_requests and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if app.active_requests:
+            logger.warning(f"Shutting down with {app.active_requests} active requests")
 
+        await app.broker.close()
+        await app.result_backend.close()
 
-@app.route(config.result_endpoint_name, methods=['GET'])
-async def result_endpoint(job_id, result_name):
-    result_backend = get_result_backend(config)
-    raw_result = await result_backend.get_job_result(job_id, result_name)
+    @app.before_request
+    async def count_request():
+        app.active_requests += 1
 
-    async def raw_result_iterator(raw_result):
-        while True:
-            chunk = await raw_result.read(config)
-            if not chunk:
-                break
-            yield chunk
+    @app.teardown_request
+    async def uncount_request(exc=None):
+        app.active_requests -= 1
 
-    return raw_result_iterator(raw_result)
+    @app.route(config.main_endpoint_name, methods=['GET', 'POST'])
+    async def endpoint():
+        if request.method == 'GET':
+            wps_request = parse_kvp_request(request.args)
+        elif request.method == 'POST':
+            data = bytes(await request.get_data())
+            wps_request = parse_xml_request(data)
 
+        client = get_client_key(config, request.headers, request.remote_addr)
+        return await dispatch(
+            app.process_registry, app.broker, config, wps_request, client
+        )
+
+    @app.route(config.result_endpoint_name, methods=['GET'])
+    async def result_endpoint(job_id, result_name):
+        raw_result = await app.result_backend.get_job_result(str(job_id), result_name)
+        await app.broker.touch_job(str(job_id))
+        chunk_size = config.result_chunk_size
+
+        mimetype = raw_result.mimetype or 'application/octet-stream'
+        headers = {
+            'Content-Type': mimetype,
+        }
+
+        # results of running jobs are followed until they are complete, unless
+        # only the data written so far is requested
+        complete = await raw_result.is_complete()
+        if complete:
+            chunks = stream_result(raw_result, chunk_size)
+        elif request.args.get('tail', 'true').lower() != 'false':
+            headers['Cache-Control'] = 'no-store'
+            chunks = tail_result(
+                raw_result, chunk_size,
+                config.result_tail_interval, config.result_tail_timeout
+            )
+        else:
+            headers['Cache-Control'] = 'no-store'
+            chunks = stream_result(raw_result, chunk_size, 0, await raw_result.size())
+
+        encoding = raw_result.encoding
+        if encoding:
+            headers['Vary'] = 'Accept-Encoding'
+            if not accepts_encoding(request.headers.get('Accept-Encoding'), encoding):
+                # the client does not understand how the result is stored
+                if complete:
+                    headers['Content-Length'] = str(await raw_result.original_size())
+                return decode_stream(chunks, encoding), 200, headers
+
+            # pass the stored compressed data through
+            headers['Content-Encoding'] = encoding
+
+        if not complete:
+            return chunks, 200, headers
+
+        size = await raw_result.size()
+        etag = await raw_result.etag()
+        if etag and encoding:
+            # the compressed representation is a different entity
+            etag = f'{etag}-{encoding}'
+        headers['Accept-Ranges'] = 'bytes'
+        if etag:
+            headers['ETag'] = f'"{etag}"'
+
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            raw_result.close()
+            return '', 304, headers
+
+        ranges = None
+        range_header = request.headers.get('Range')
+        if range_header and if_range_matches(request.headers.get('If-Range'), etag):
+            try:
+                ranges = parse_range_header(range_header, size)
+            except UnsatisfiableRange:
+                raw_result.close()
+                return '', 416, {'Content-Range': f'bytes */{size}'}
+
+        if not ranges:
+            headers['Content-Length'] = str(size)
+            return stream_result(raw_result, chunk_size), 200, headers
+
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+            headers['Content-Length'] = str(end - start)
+            return stream_result(raw_result, chunk_size, start, end), 206, headers
+
+        boundary = uuid4().hex
+        body, length = multipart_byteranges(
+            raw_result, ranges, size, mimetype, boundary, chunk_size
+        )
+        headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        headers['Content-Length'] = str(length)
+        return body, 206, headers
+
+    @app.errorhandler(NoSuchResult)
+    async def no_such_result(error):
+        # unknown outputs, and outputs deleted by expiry or eviction
+        return str(error), 404, {'Content-Type': 'text/plain'}
+
+    @app.route(config.status_stream_endpoint_name, methods=['GET'])
+    async def status_stream_endpoint(job_ids):
+        job_ids = [job_id for job_id in job_ids.split(',') if job_id]
+        headers = {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-store',
+            # keep reverse proxies from buffering the events
+            'X-Accel-Buffering': 'no',
+        }
+        return status_events(app.broker, config, job_ids), 200, headers
+
+    return app
+
+
+APP = None
+
+def __getattr__(name):
+    """ Create the application on first access of `wpys.server.app`, so that
+        importing the module does not require the configuration.
+    """
+    global APP
+    if name == 'app':
+        if APP is None:
+            APP = create_app()
+        return APP
+    raise AttributeError(name)
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import time
+
+from .config import WPySConfig
+
+STATUS_CACHE = None
+
+
+class StatusCache:
+    """ LRU cache of encoded StatusInfo documents per job. Entries are
+        dropped whenever the broker publishes an update of the job.
+
+        A read reserves the entry before fetching the job, so that the
+        result is only stored when the job was not updated in between.
+        Entries expire after `max_age` seconds, as jobs expiring in Redis
+        publish no update.
+    """
+    def __init__(self, broker, max_entries, max_age):
+        self.broker = broker
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()
+
+    def get(self, job_id):
+        if self.broker.subscriber is None:
+            # without notifications, entries could not be invalidated
+            return None
+        entry = self.entries.get(job_id)
+        if isinstance(entry, tuple):
+            data, stored = entry
+            if time.monotonic() - stored > self.max_age:
+                del self.entries[job_id]
+                return None
+            self.entries.move_to_end(job_id)
+            return data
+        return None
+
+    def reserve(self, job_id):
+        """ Mark that the status of the job is being fetched. Returns the
+            token to pass to `put`, or `None` when the result cannot be
+            stored.
+        """
+        if self.broker.subscriber is None:
+            # updates published until subscribing again would be missed
+            return None
+        token = object()
+        self.entries[job_id] = token
+        self.entries.move_to_end(job_id)
+        self._evict()
+        return token
+
+    def put(self, job_id, token, data):
+        if token is not None and self.entries.get(job_id) is token:
+            self.entries[job_id] = (data, time.monotonic())
+
+    def invalidate(self, job_id=None):
+        if job_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(job_id, None)
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+async def get_status_cache(broker, config: WPySConfig):
+    global STATUS_CACHE
+
+    # the cache is bound to the notifications of the broker of this process
+    stale = STATUS_CACHE is not None and STATUS_CACHE.broker is not broker
+    if (STATUS_CACHE is None or stale) and config.status_cache_max_entries:
+        STATUS_CACHE = StatusCache(
+            broker, config.status_cache_max_entries, config.status_cache_max_age
+        )
+        await broker.add_status_listener(STATUS_CACHE.invalidate)
+
+    return STATUS_CACHE
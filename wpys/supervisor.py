@@ -0,0 +1,290 @@
+import asyncio
+from collections.abc import Iterator
+import inspect
+import multiprocessing
+import resource
+import signal
+import time
+import traceback
+from math import ceil
+
+from .job import ResourceLimitExceeded, JobTimeout, Result, Output, to_bytes
+
+__all__ = ['SupervisedProcess']
+
+# size of the chunks streamed outputs are read from the child in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _RemoteTraceback(Exception):
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _iterate(fn, args, kwargs):
+    """ Iterate over the chunks of any kind of process function.
+    """
+    if inspect.isgeneratorfunction(fn):
+        yield from fn(*args, **kwargs)
+    elif inspect.isasyncgenfunction(fn):
+        loop = asyncio.new_event_loop()
+        async_generator = fn(*args, **kwargs)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(async_generator.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(async_generator.aclose())
+            loop.close()
+    elif inspect.iscoroutinefunction(fn):
+        yield asyncio.run(fn(*args, **kwargs))
+    else:
+        yield fn(*args, **kwargs)
+
+
+class _RemoteStream(Iterator):
+    """ Stands in for a file-like object or an iterator yielded by the
+        process. The parent reads it from the child chunk by chunk, so that
+        outputs are neither held in memory nor sent as a whole.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+
+    def __getstate__(self):
+        return {'index': self.index, 'process': None}
+
+    def __next__(self):
+        data = self.process.read_stream(self.index)
+        if not data:
+            raise StopIteration
+        return data
+
+
+def _is_stream(value):
+    return hasattr(value, 'read') or isinstance(value, Iterator)
+
+
+def _make_sendable(chunk, streams):
+    """ Replace the streamed values of a chunk, which cannot be sent to the
+        parent, with `_RemoteStream`s. The streams are appended to `streams`.
+    """
+    if type(chunk) in (list, tuple):
+        return type(chunk)(_make_sendable(part, streams) for part in chunk)
+    elif isinstance(chunk, Result):
+        chunk.output = _make_sendable(chunk.output, streams)
+        return chunk
+    elif isinstance(chunk, Output):
+        if chunk.file is not None:
+            chunk.set_file(_make_sendable(chunk.file, streams))
+        return chunk
+    elif _is_stream(chunk):
+        streams.append(chunk)
+        return _RemoteStream(len(streams) - 1)
+    return chunk
+
+
+def _read_stream(stream):
+    if hasattr(stream, 'read'):
+        return to_bytes(stream.read(STREAM_CHUNK_SIZE))
+    return to_bytes(next(stream, b''))
+
+
+def _close_streams(streams):
+    for stream in streams:
+        if hasattr(stream, 'close'):
+            stream.close()
+    streams.clear()
+
+
+def _send_error(connection, e):
+    tb = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+    try:
+        connection.send(("error", (e, tb)))
+    except Exception:
+        # the exception itself could not be pickled
+        connection.send(("error", (Exception(repr(e)), tb)))
+
+
+def _child_main(connection, fn, args, kwargs, limits):
+    """ Entry point of the child process: apply the resource limits and
+        advance the process one chunk at a time when the parent asks for it.
+    """
+    if limits.cpu_time is not None:
+        cpu_time = ceil(limits.cpu_time)
+        # SIGXCPU on the soft limit, SIGKILL one second later
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+    if limits.memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+
+    iterator = _iterate(fn, args, kwargs)
+    # streams of the last chunk, read by the parent until it asks for the
+    # next chunk
+    streams = []
+    try:
+        while True:
+            request = connection.recv()
+            if request == "next":
+                _close_streams(streams)
+                try:
+                    chunk = _make_sendable(next(iterator), streams)
+                except StopIteration:
+                    connection.send(("finished", None))
+                    break
+                except Exception as e:
+                    _send_error(connection, e)
+                    break
+                try:
+                    connection.send(("chunk", chunk))
+                except Exception as e:
+                    # pickling failed before anything was sent
+                    _send_error(connection, TypeError(
+                        f"Process yielded a value that cannot be stored: {e!r}"
+                    ))
+                    break
+            elif isinstance(request, tuple) and request[0] == "read":
+                try:
+                    data = _read_stream(streams[request[1]])
+                except Exception as e:
+                    _send_error(connection, e)
+                    break
+                connection.send(("data", data))
+            else:
+                break
+    except EOFError:
+        pass
+    finally:
+        _close_streams(streams)
+        iterator.close()
+        connection.close()
+
+
+class SupervisedProcess:
+    """ Runs a process function in a child process with the given resource
+        limits applied. The child is advanced chunk by chunk, so generator
+        processes are suspended at their yield points in between. Streamed
+        outputs of a chunk are read from the child until the next chunk is
+        requested. All methods are blocking and meant to be run in an
+        executor.
+
+        Children are forked from a forkserver rather than from the worker,
+        whose threads may hold locks the child would inherit. The function
+        and its arguments are therefore pickled.
+    """
+    def __init__(self, fn, args, kwargs, limits):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.limits = limits
+
+        self.connection = None
+        self.child = None
+        self.deadline = None
+
+    def start(self):
+        context = multiprocessing.get_context('forkserver')
+        self.connection, child_connection = context.Pipe()
+        self.child = context.Process(
+            target=_child_main,
+            args=(child_connection, self.fn, self.args, self.kwargs, self.limits),
+            daemon=True,
+        )
+        self.child.start()
+        child_connection.close()
+
+        if self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+
+    def next(self, default=None):
+        """ Let the child run until it produces its next chunk. Returns
+            `default` when the process is finished.
+        """
+        kind, value = self._request("next")
+        if kind == "finished":
+            self.child.join()
+            return default
+        return self._bind_streams(value)
+
+    def read_stream(self, index):
+        """ Read the next piece of a streamed output of the current chunk,
+            empty bytes at its end.
+        """
+        kind, value = self._request(("read", index))
+        return value
+
+    def _request(self, request):
+        timeout = None
+        if self.deadline is not None:
+            timeout = max(0, self.deadline - time.monotonic())
+
+        try:
+            self.connection.send(request)
+            if not self.connection.poll(timeout):
+                self.kill()
+                raise JobTimeout(
+                    f"Job exceeded its time limit of {self.limits.timeout} seconds"
+                )
+            kind, value = self.connection.recv()
+        except (EOFError, OSError):
+            self.child.join()
+            raise ResourceLimitExceeded(self._describe_exit())
+
+        if kind != "error":
+            return kind, value
+
+        exception, tb = value
+        self.child.join()
+        if isinstance(exception, MemoryError) and self.limits.memory is not None:
+            raise ResourceLimitExceeded(
+                f"Job exceeded its memory limit of {self.limits.memory} bytes"
+            ) from _RemoteTraceback(tb)
+        raise exception from _RemoteTraceback(tb)
+
+    def _bind_streams(self, chunk):
+        if type(chunk) in (list, tuple):
+            for part in chunk:
+                self._bind_streams(part)
+        elif isinstance(chunk, Result):
+            self._bind_streams(chunk.output)
+        elif isinstance(chunk, Output):
+            self._bind_streams(chunk.file)
+        elif isinstance(chunk, _RemoteStream):
+            chunk.process = self
+        return chunk
+
+    def kill(self):
+        """ Terminate the child immediately.
+        """
+        if self.child is not None and self.child.is_alive():
+            self.child.kill()
+
+    def close(self):
+        """ Stop the child at its current yield point and release all
+            resources.
+        """
+        if self.child is None:
+            return
+
+        if self.child.is_alive():
+            try:
+                self.connection.send("close")
+            except OSError:
+                pass
+            self.child.join(1)
+            self.kill()
+        self.child.join()
+        self.connection.close()
+
+    def _describe_exit(self):
+        exitcode = self.child.exitcode
+        if exitcode == -signal.SIGXCPU or (
+                exitcode == -signal.SIGKILL and self.limits.cpu_time is not None):
+            return f"Job exceeded its CPU time limit of {self.limits.cpu_time} seconds"
+        elif exitcode == -signal.SIGKILL:
+            return "Job was killed"
+        return f"Job terminated unexpectedly with exit code {exitcode}"
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+
+from .broker import get_broker
+from .exceptions import NoSuchResult
+from .job import to_bytes
+from .redis.backend import RedisResultBackend
+from .filesystem.backend import FileSystemResultBackend
+
+INLINE_TIER = "inline"
+REDIS_TIER = "redis"
+FILESYSTEM_TIER = "filesystem"
+
+
+class InlineResult:
+    """ File-like reader of a result stored in the job record.
+    """
+    encoding = None
+
+    def __init__(self, data, mimetype=None):
+        self.data = data
+        self.mimetype = mimetype
+        self._offset = 0
+
+    async def read(self, size=None):
+        end = len(self.data) if size is None else self._offset + size
+        data = self.data[self._offset:end]
+        self._offset += len(data)
+        return data
+
+    async def seek(self, offset, from_what=0):
+        if from_what == 0:
+            self._offset = offset
+        elif from_what == 1:
+            self._offset += offset
+        elif from_what == 2:
+            self._offset = len(self.data) + offset
+
+    def tell(self):
+        return self._offset
+
+    async def size(self):
+        return len(self.data)
+
+    async def original_size(self):
+        return len(self.data)
+
+    async def is_complete(self):
+        return True
+
+    async def etag(self):
+        return hashlib.sha256(self.data).hexdigest()
+
+    def close(self):
+        pass
+
+
+class TieredResultWriter:
+    """ Writes a result to the tier matching its size. When the size is not
+        known in advance, the data is buffered until it exceeds the inline
+        size and then written to the filesystem tier. The chosen tier is
+        `None` until then.
+    """
+    def __init__(self, backend, job_id, output_name, mimetype=None, size=None):
+        self.backend = backend
+        self.job_id = job_id
+        self.output_name = output_name
+        self.mimetype = mimetype
+        self.tier = None
+        self.writer = None
+        self._buffer = bytearray()
+
+        if size is not None:
+            self.tier = backend.choose_tier(size)
+
+    async def _open(self, size=None):
+        tier_backend = self.backend.tiers[self.tier]
+        self.writer = await tier_backend.open_job_result(
+            self.job_id, self.output_name, self.mimetype, size
+        )
+
+    async def write(self, data):
+        data = to_bytes(data)
+        if self.tier is None:
+            self._buffer += data
+            if len(self._buffer) <= self.backend.inline_max_size:
+                return
+            self.tier = FILESYSTEM_TIER
+            data, self._buffer = bytes(self._buffer), bytearray()
+
+        if self.tier == INLINE_TIER:
+            self._buffer += data
+            return
+
+        if self.writer is None:
+            await self._open()
+        await self.writer.write(data)
+
+    async def close(self):
+        if self.tier is None:
+            self.tier = INLINE_TIER
+        if self.writer is not None:
+            await self.writer.close()
+        elif self.tier != INLINE_TIER:
+            await self._open(0)
+            await self.writer.close()
+
+
+class TieredResultBackend:
+    """ Stores results depending on their size: outputs up to
+        `inline_result_max_size` bytes are kept in the job record only, and
+        are fetched together with the job. Outputs up to
+        `result_redis_max_size` bytes are stored in Redis, larger ones on the
+        filesystem. The worker records the tier of each output with the job.
+    """
+    def __init__(self, broker, redis_backend, filesystem_backend, config):
+        self.broker = broker
+        self.config = config
+        self.inline_max_size = config.inline_result_max_size
+        self.tiers = {
+            REDIS_TIER: redis_backend,
+            FILESYSTEM_TIER: filesystem_backend,
+        }
+
+    def choose_tier(self, size):
+        if size <= self.inline_max_size:
+            return INLINE_TIER
+        elif size <= self.config.result_redis_max_size:
+            return REDIS_TIER
+        return FILESYSTEM_TIER
+
+    async def open_job_result(self, job_id, output_name, mimetype=None,
+                              size=None) -> TieredResultWriter:
+        await self.delete_job_result(job_id, output_name)
+        return TieredResultWriter(self, job_id, output_name, mimetype, size)
+
+    async def put_job_result(self, job_id, output_name, result, mimetype=None):
+        result = to_bytes(result)
+        writer = await self.open_job_result(job_id, output_name, mimetype, len(result))
+        await writer.write(result)
+        await writer.close()
+
+    async def get_job_result(self, job_id, output_name):
+        """ Look up the tier of the result in the job record, results of the
+            inline tier are read from it directly.
+        """
+        job = await self.broker.get_job(job_id, raise_if_not_exist=False)
+        result = next((
+            result for result in job.results
+            if result.identifier == output_name
+        ), None) if job else None
+
+        if result is None or result.tier is None:
+            raise NoSuchResult(f"No result {output_name} for job {job_id}")
+        elif result.tier == INLINE_TIER:
+            return InlineResult(result.data, result.mimetype)
+        return await self.tiers[result.tier].get_job_result(job_id, output_name)
+
+    async def delete_job_result(self, job_id, output_name):
+        for tier_backend in self.tiers.values():
+            await tier_backend.delete_job_result(job_id, output_name)
+
+    async def delete_job_results(self, job_id):
+        for tier_backend in self.tiers.values():
+            await tier_backend.delete_job_results(job_id)
+
+    async def iter_job_results(self):
+        for tier_backend in self.tiers.values():
+            async for job_id, output_name in tier_backend.iter_job_results():
+                yield job_id, output_name
+
+    async def close(self):
+        for tier_backend in self.tiers.values():
+            await tier_backend.close()
+
+    @classmethod
+    async def get_backend(cls, config, loop=None):
+        broker = await get_broker(config, loop or asyncio.get_event_loop())
+        return cls(
+            broker,
+            await RedisResultBackend.get_backend(config, loop),
+            await FileSystemResultBackend.get_backend(config, loop),
+            config,
+        )
@@ -1,19 +1,74 @@
-from collections.abc import Iterable
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import inspect
 from functools import partial
 import logging
 import traceback
+import time
+from uuid import uuid4
 
-from .job import Job, JobStatus, Result, Status
+from .job import (
+    Job, JobStatus, JobResult, JobOutputReference, Result, ResultPart, Status,
+    Checkpoint, Output, to_bytes,
+)
+from .process import CHECKPOINT_PARAMETER
+from .supervisor import SupervisedProcess
+from .retention import Retention
+from .encoding import Result as ResultDocument, encode_response
+from .compression import decode_stream
+from .ranges import stream_result
 
 logger = logging.getLogger(__name__)
 
+# sentinel returned by `next` when a generator process is exhausted
+_FINISHED = object()
+
 class CancelledError(Exception):
     pass
 
 
+class _ResultWriter:
+    """ Wraps a writer of the result backend, counting the written bytes and
+        keeping the data as long as it fits the inline or the handoff size.
+    """
+    def __init__(self, writer, inline_size, handoff_size=0):
+        self.writer = writer
+        self.inline_size = inline_size
+        self.handoff_size = handoff_size
+        self.size = 0
+        self._head = bytearray()
+
+    async def write(self, data):
+        data = to_bytes(data)
+        self.size += len(data)
+        if self.size <= max(self.inline_size, self.handoff_size):
+            self._head += data
+        else:
+            self._head = bytearray()
+        await self.writer.write(data)
+
+    async def close(self):
+        await self.writer.close()
+
+    @property
+    def tier(self):
+        return self.writer.tier
+
+    @property
+    def data(self):
+        if self.size <= self.inline_size:
+            return bytes(self._head)
+        return None
+
+    @property
+    def handoff_data(self):
+        if self.size <= self.handoff_size:
+            return bytes(self._head)
+        return None
+
+
 class Worker:
     """ Class to work on jobs
     """
@@ -22,105 +77,448 @@ class Worker:
         self.broker = broker
         self.backend = backend
         self.executor = ThreadPoolExecutor(1)
+        # writers of incrementally written outputs per job
+        self.result_writers = {}
+        self.retention = Retention(broker, backend, broker.config)
+        self.identifier = uuid4().hex
+        # recent outputs by job and output ID, passed to chained jobs
+        self.handoff_results = OrderedDict()
+        self.handoff_size = 0
+        # IDs of running jobs that shall be paused at their next yield point
+        self.pause_requests = set()
+        # blocking calls of dismissed jobs still running in the background
+        self.abandoned_calls = []
 
     async def run(self):
         """ The main function to iteratively run jobs
         """
-        print('Running worker')
+        logger.info(f'Running worker {self.identifier}')
+        if self.broker.config.retention_sweep_interval:
+            asyncio.ensure_future(self.retention.run())
+        asyncio.ensure_future(self._heartbeat())
+
         while True:
             # wait for a job
-            job = await self.broker.pick_job()
-            print(f'Picked job {job.identifier}')
-
+            job = await self.broker.pick_job(self.identifier)
             if not job:
                 continue
+            logger.debug(f'Picked job {job.identifier}')
+
+            if job.process.batch_size:
+                await self._run_batch(job)
+                continue
+
+            # create a task to see if the job shall be cancelled or paused.
+            # The channel is watched before checking whether the job was
+            # dismissed in the meantime, so that no message is missed.
+            control_queue = await self.broker.watch_job_control(job.identifier)
+            control_task = asyncio.ensure_future(
+                self._watch_job_control(job, control_queue)
+            )
+            # keep the slot of the processes concurrency limit and the count
+            # as inflight job while running
+            lease_task = asyncio.ensure_future(self._renew_process_slot(job))
+
+            started = time.monotonic()
+            try:
+                if await self.broker.is_job_dismissed(job.identifier):
+                    logger.info(f'Job {job.identifier} was dismissed before it started')
+                    await self._handle_job_cancelled(job)
+                else:
+                    job.status = JobStatus.RUNNING
+                    job.worker = self.identifier
+                    await self.broker.update_job(job)
+                    try:
+                        inputs = await self._resolve_inputs(job)
+                    except Exception as e:
+                        await self._handle_job_exception(job, e)
+                    else:
+                        await self._run_job(job, inputs, control_task)
+            finally:
+                control_task.cancel()
+                lease_task.cancel()
+                self.pause_requests.discard(job.identifier)
+                await self.broker.release_process_slot(job)
+                await self.broker.finish_job(job, time.monotonic() - started)
+
+    async def _watch_job_control(self, job, queue):
+        """ Wait until the job is dismissed. Pause requests are recorded, to
+            be handled at the next yield point of the job.
+        """
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    # messages may have been missed, check what they were
+                    if await self.broker.is_job_dismissed(job.identifier):
+                        return "dismiss"
+                    elif await self.broker.is_pause_requested(job.identifier):
+                        self.pause_requests.add(job.identifier)
+                elif message == "dismiss":
+                    return message
+                elif message == "pause":
+                    self.pause_requests.add(job.identifier)
+        finally:
+            self.broker.unwatch_job_control(job.identifier, queue)
+
+    def _take_pause_request(self, job):
+        """ Check whether the job shall be paused at its current yield point.
+            Jobs writing outputs incrementally are not paused: the resumed
+            job would not yield the parts written so far again, so the
+            outputs would be incomplete.
+        """
+        if job.identifier not in self.pause_requests:
+            return False
+        self.pause_requests.discard(job.identifier)
+        if self.result_writers.get(job.identifier):
+            logger.warning(
+                f'Not pausing job {job.identifier}, it is writing outputs incrementally'
+            )
+            return False
+        return True
+
+    async def _abandon_executor(self, job, call, close=None):
+        """ Leave a blocking call of a cancelled job to finish in the
+            background, and continue with a new executor. `close` is run
+            after the call returned. When too many calls are still running,
+            the worker waits for this one instead.
+        """
+        if close is not None:
+            # the executor runs it once the call returned
+            call = asyncio.wrap_future(self.executor.submit(close))
+        self.abandoned_calls = [
+            abandoned for abandoned in self.abandoned_calls if not abandoned.done()
+        ]
+        if len(self.abandoned_calls) >= self.broker.config.worker_max_abandoned_calls:
+            logger.warning(
+                f'Waiting for the blocking call of dismissed job {job.identifier}, '
+                f'{len(self.abandoned_calls)} calls are already left running'
+            )
+            await asyncio.wait([call])
+            return
+
+        logger.warning(
+            f'Leaving the blocking call of dismissed job {job.identifier} '
+            f'running in the background'
+        )
+        self.abandoned_calls.append(call)
+        self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(1)
+
+    async def _heartbeat(self):
+        """ Keep the worker registered, so that it is counted when estimating
+            the wait of queued jobs.
+        """
+        interval = self.broker.config.worker_heartbeat_interval
+        while True:
+            await self.broker.register_worker(self.identifier, interval * 3)
+            await asyncio.sleep(interval)
+
+    async def _resolve_inputs(self, job):
+        """ Get the values of inputs that are outputs of other jobs.
+        """
+        inputs = []
+        for value in job.inputs:
+            if isinstance(value, JobOutputReference):
+                data = await self._get_job_output(value.job_id, value.output_id)
+                value = job.process.parse_job_output(value, data)
+            inputs.append(value)
+        return inputs
+
+    async def _get_job_output(self, job_id, output_id):
+        """ Get an output of a job, from memory when this worker produced it,
+            otherwise from the job record or the result backend.
+        """
+        data = self.handoff_results.get((job_id, output_id))
+        if data is not None:
+            self.handoff_results.move_to_end((job_id, output_id))
+            return data
+
+        job = await self.broker.get_job(job_id)
+        for result in job.results:
+            if result.identifier == output_id and result.data is not None:
+                return result.data
+
+        raw_result = await self.backend.get_job_result(job_id, output_id)
+        chunks = stream_result(raw_result, self.broker.config.result_chunk_size)
+        if raw_result.encoding:
+            chunks = decode_stream(chunks, raw_result.encoding)
+        return b''.join([chunk async for chunk in chunks])
 
-            # create a task to see if the job shall be cancelled
-            cancelled_task = asyncio.ensure_future(
-                self.broker.get_job_notification(job.identifier)
+    def _keep_handoff_result(self, job_id, output_id, data):
+        """ Keep an output in memory for chained jobs, evicting the least
+            recently used ones beyond `handoff_cache_max_size`.
+        """
+        key = (job_id, output_id)
+        old = self.handoff_results.pop(key, None)
+        if old is not None:
+            self.handoff_size -= len(old)
+        self.handoff_results[key] = data
+        self.handoff_size += len(data)
+        while self.handoff_size > self.broker.config.handoff_cache_max_size:
+            _, evicted = self.handoff_results.popitem(last=False)
+            self.handoff_size -= len(evicted)
+
+    async def _run_job(self, job, inputs, control_task):
+        kwargs = {}
+        if job.process.resumable:
+            kwargs[CHECKPOINT_PARAMETER] = job.checkpoint
+
+        limits = job.limits or job.process.limits
+        if limits:
+            # run the job in a child process, so that it can be terminated
+            # when it exceeds its limits
+            supervised = SupervisedProcess(
+                job.process.fn, inputs, kwargs, limits
             )
+            await self._run_supervised(job, supervised, control_task)
+        elif inspect.isgeneratorfunction(job.process.fn):
+            generator = job.process.fn(*inputs, **kwargs)
+            await self._run_generator(job, generator, control_task)
+        elif inspect.isasyncgenfunction(job.process.fn):
+            async_generator = job.process.fn(*inputs, **kwargs)
+            await self._run_async_generator(job, async_generator, control_task)
+        elif inspect.iscoroutinefunction(job.process.fn):
+            coroutine = job.process.fn(*inputs)
+            await self._run_coroutine(job, coroutine, control_task)
+        elif inspect.isfunction(job.process.fn):
+            func = partial(job.process.fn, *inputs)
+            await self._run_sync(job, func, control_task)
+        else:
+            # TODO
+            raise NotImplementedError
+
+    async def _run_batch(self, job):
+        """ Collect further queued jobs of the jobs batched process and run
+            them all at once.
+        """
+        process = job.process
+        jobs = [job] + await self.broker.pick_batch(
+            process, process.batch_size - 1, process.batch_wait_ms / 1000
+        )
+        inputs = []
+        for job in list(jobs):
+            if await self.broker.is_job_dismissed(job.identifier):
+                jobs.remove(job)
+                await self._handle_job_cancelled(job)
+                await self.broker.release_process_slot(job)
+                await self.broker.finish_job(job)
+                continue
+            job.status = JobStatus.RUNNING
+            job.worker = self.identifier
+            await self.broker.update_job(job)
+            try:
+                inputs.append(await self._resolve_inputs(job))
+            except Exception as e:
+                jobs.remove(job)
+                await self._handle_job_exception(job, e)
+                await self.broker.release_process_slot(job)
+                await self.broker.finish_job(job)
+        if not jobs:
+            return
+
+        lease_task = asyncio.gather(*[
+            self._renew_process_slot(job) for job in jobs
+        ])
+        started = time.monotonic()
+        try:
+            await self._run_batched_call(jobs, inputs)
+        finally:
+            lease_task.cancel()
+            # the jobs of the batch share its duration
+            duration = (time.monotonic() - started) / len(jobs)
+            for job in jobs:
+                await self.broker.release_process_slot(job)
+                await self.broker.finish_job(job, duration)
+
+    async def _run_batched_call(self, jobs, inputs):
+        process = jobs[0].process
+        logger.debug(f'Running batch of {len(jobs)} jobs of {process.identifier}')
 
-            if inspect.isgeneratorfunction(job.process.fn):
-                generator = job.process.fn(*job.inputs)
-                await self._run_generator(job, generator, cancelled_task)
-            elif inspect.isasyncgenfunction(job.process.fn):
-                async_generator = job.process.fn(*job.inputs)
-                await self._run_async_generator(job, async_generator, cancelled_task)
-            elif inspect.iscoroutinefunction(job.process.fn):
-                coroutine = job.process.fn(*job.inputs)
-                await self._run_coroutine(job, coroutine, cancelled_task)
-            elif inspect.isfunction(job.process.fn):
-                func = partial(job.process.fn, *job.inputs)
-                await self._run_sync(job, func, cancelled_task)
+        # one list of values per input
+        stacked = [list(values) for values in zip(*inputs)]
+        # the limits requested for the jobs apply to the whole call, when it
+        # exceeds them the jobs are run separately with their own limits
+        limits = process.limits
+        for job in jobs:
+            limits = limits.restrict(job.limits or process.limits)
+        supervised = None
+        try:
+            if limits:
+                supervised = SupervisedProcess(process.fn, stacked, {}, limits)
+                await self.loop.run_in_executor(self.executor, supervised.start)
+                results = await self.loop.run_in_executor(
+                    self.executor, supervised.next
+                )
             else:
-                # TODO
-                raise NotImplementedError
+                results = await self.loop.run_in_executor(
+                    self.executor, partial(process.fn, *stacked)
+                )
+            results = list(results)
+            if len(results) != len(jobs):
+                raise Exception(
+                    f"Batched process returned {len(results)} results for "
+                    f"{len(jobs)} jobs"
+                )
+        except Exception as e:
+            if supervised is not None:
+                await self.loop.run_in_executor(self.executor, supervised.close)
+            if len(jobs) == 1:
+                await self._handle_job_exception(jobs[0], e)
+                return
+            # run the jobs one by one, so that only the affected ones fail
+            logger.warning(f'Batch of {process.identifier} failed, running jobs separately')
+            for job, job_inputs in zip(jobs, inputs):
+                await self._run_batched_call([job], [job_inputs])
+            return
 
-    async def _run_generator(self, job, generator, cancelled_task):
+        try:
+            for job, result in zip(jobs, results):
+                if await self.broker.is_job_dismissed(job.identifier):
+                    # dismissed before it started running, after the check
+                    await self._handle_job_cancelled(job)
+                elif isinstance(result, Exception):
+                    await self._handle_job_exception(job, result)
+                else:
+                    try:
+                        await self._handle_job_chunk(job, result)
+                        await self._handle_job_finished(job)
+                    except Exception as e:
+                        await self._handle_job_exception(job, e)
+        finally:
+            # streamed results are read from the child
+            if supervised is not None:
+                await self.loop.run_in_executor(self.executor, supervised.close)
+
+    async def _renew_process_slot(self, job):
+        # also renews the lease of the job as inflight job
+        while True:
+            await asyncio.sleep(self.broker.config.concurrency_lease_time / 3)
+            await self.broker.renew_process_slot(job)
+
+    async def _run_generator(self, job, generator, control_task):
         logger.debug(f'Running job {job.identifier} as generator')
+        await self._run_stepwise(
+            job, partial(next, generator, _FINISHED), generator.close,
+            control_task
+        )
+
+    async def _run_supervised(self, job, supervised, control_task):
+        logger.debug(f'Running job {job.identifier} in a supervised process')
+        await self.loop.run_in_executor(self.executor, supervised.start)
+        try:
+            await self._run_stepwise(
+                job, partial(supervised.next, _FINISHED), supervised.close,
+                control_task, terminate=supervised.kill
+            )
+        finally:
+            await self.loop.run_in_executor(self.executor, supervised.close)
+
+    async def _run_stepwise(self, job, step, close, control_task, terminate=None):
+        """ Run the blocking `step` in the executor until it returns the
+            `_FINISHED` sentinel and handle each returned chunk.
+        """
         while True:
-            main_task = self.loop.run_in_executor(self.executor, next, generator)
+            main_task = self.loop.run_in_executor(self.executor, step)
             await asyncio.wait(
-                [main_task, cancelled_task], return_when=asyncio.FIRST_COMPLETED
+                [main_task, control_task], return_when=asyncio.FIRST_COMPLETED
             )
 
             # detect whether the job was cancelled
-            if cancelled_task.done():
-                self._handle_job_cancelled(job)
-                generator.throw(CancelledError)
+            if control_task.done() and control_task.result() == "dismiss":
+                await self._handle_job_cancelled(job)
+                if terminate:
+                    terminate()
+                elif not main_task.done():
+                    # the running step cannot be interrupted
+                    await self._abandon_executor(job, main_task, close)
+                    break
+                # the job can only be closed when it is suspended
+                await asyncio.wait([main_task])
+                await self.loop.run_in_executor(self.executor, close)
                 break
 
-            else:
-                try:
-                    chunk = main_task.result()
-                    await self._handle_job_chunk(job, chunk)
-                except StopIteration:
+            try:
+                chunk = await main_task
+            except Exception as e:
+                await self._handle_job_exception(job, e)
+                break
+
+            try:
+                if chunk is _FINISHED:
                     await self._handle_job_finished(job)
                     break
-                except Exception as e:
-                    await self._handle_job_exception(job, e)
-                    break
+                await self._handle_job_chunk(job, chunk)
+            except Exception as e:
+                await self._handle_job_exception(job, e)
+                # the job may be suspended at a yield point
+                await self.loop.run_in_executor(self.executor, close)
+                break
 
+            # the job is now suspended at a yield point, so it can be
+            # paused with its last checkpoint
+            if self._take_pause_request(job):
+                await self.loop.run_in_executor(self.executor, close)
+                await self._handle_job_paused(job)
+                break
 
-    async def _run_async_generator(self, job, async_generator, cancelled_task):
+    async def _run_async_generator(self, job, async_generator, control_task):
         try:
-            async for chunk in async_generator:
-                if cancelled_task.done():
+            while True:
+                next_task = asyncio.ensure_future(async_generator.__anext__())
+                await asyncio.wait(
+                    [next_task, control_task], return_when=asyncio.FIRST_COMPLETED
+                )
+                if control_task.done() and control_task.result() == "dismiss":
+                    # interrupt the generator, wherever it is awaiting
+                    next_task.cancel()
+                    await asyncio.wait([next_task])
                     await self._handle_job_cancelled(job)
-                    await async_generator.athrow(CancelledError)
                     break
+
+                try:
+                    chunk = await next_task
+                except StopAsyncIteration:
+                    await self._handle_job_finished(job)
+                    break
+
                 await self._handle_job_chunk(job, chunk)
-            await self._handle_job_finished(job)
+                if self._take_pause_request(job):
+                    await async_generator.aclose()
+                    await self._handle_job_paused(job)
+                    break
         except Exception as e:
             await self._handle_job_exception(job, e)
 
-    async def _run_coroutine(self, job, coroutine, cancelled_task):
+    async def _run_coroutine(self, job, coroutine, control_task):
         main_task = asyncio.ensure_future(coroutine)
         await asyncio.wait(
-            [main_task, cancelled_task], return_when=asyncio.FIRST_COMPLETED
+            [main_task, control_task], return_when=asyncio.FIRST_COMPLETED
         )
 
-        if cancelled_task.done():
+        if control_task.done():
+            main_task.cancel()
+            await asyncio.wait([main_task])
             await self._handle_job_cancelled(job)
-            await main_task.athrow(CancelledError)
         else:
             try:
                 chunk = main_task.result()
                 await self._handle_job_chunk(job, chunk)
+                await self._handle_job_finished(job)
             except Exception as e:
                 await self._handle_job_exception(job, e)
 
-    async def _run_sync(self, job, sync, cancelled_task):
+    async def _run_sync(self, job, sync, control_task):
         main_task = self.loop.run_in_executor(self.executor, sync)
         await asyncio.wait(
-            [main_task, cancelled_task], return_when=asyncio.FIRST_COMPLETED
+            [main_task, control_task], return_when=asyncio.FIRST_COMPLETED
         )
 
-        if cancelled_task.done():
+        if control_task.done():
             await self._handle_job_cancelled(job)
-
-            # wait for the main task to finish
-            await main_task
+            if not main_task.done():
+                # the function cannot be interrupted
+                await self._abandon_executor(job, main_task)
         else:
             try:
                 chunk = main_task.result()
@@ -131,31 +529,204 @@ class Worker:
 
     async def _handle_job_chunk(self, job, chunk):
         logger.debug(f'Handling chunk for job {job.identifier}')
-        if not isinstance(chunk, Iterable):
-            chunk = [chunk]
-        for part in chunk:
-            print(f"Chunk {chunk} for job {job}")
-            if isinstance(part, Result):
-                pass
+        if chunk is None:
+            # a bare `yield` or a function without return value
+            return
+        part_types = (Result, ResultPart, Output, Status, Checkpoint)
+        parts = chunk if isinstance(chunk, (list, tuple)) else [chunk]
+        if not all(isinstance(part, part_types) for part in parts):
+            if not job.process.outputs:
+                logger.warning(
+                    f'Ignoring value of job {job.identifier}, its process has no outputs'
+                )
+                return
+            # plain return values are the result of the default output
+            parts = [Result(chunk)]
+
+        for part in parts:
+            if isinstance(part, Output):
+                await self._store_result(job, Result(part, part.identifier))
+
+            elif isinstance(part, Result):
+                await self._store_result(job, part)
+
+            elif isinstance(part, ResultPart):
+                await self._write_result_part(job, part)
 
             elif isinstance(part, Status):
-                await self.broker.update_job(job.identifier, part)
+                part.apply(job)
+                await self.broker.update_job(job)
+
+            elif isinstance(part, Checkpoint):
+                job.checkpoint = part.state
+                await self.broker.update_job(job)
+
+    def _get_output(self, job, identifier=None):
+        """ Get the identifier and mimetype of an output of the job.
+        """
+        output_def = job.process.outputs[0]
+        if identifier:
+            output_def = next(
+                output for output in job.process.outputs
+                if output.identifier == identifier
+            )
+
+        # prefer the format requested for the output
+        mimetype = output_def.formats[0].mimetype if output_def.formats else None
+        for output in job.outputs:
+            if output.identifier == output_def.identifier and output.mimetype:
+                mimetype = output.mimetype
+        return output_def.identifier, mimetype
+
+    async def _open_result(self, job, identifier, mimetype, size=None):
+        """ Create an output in the result backend and register it with the
+            job.
+        """
+        writer = await self.backend.open_job_result(
+            job.identifier, identifier, mimetype, size
+        )
+        job.results = [
+            *(result for result in job.results if result.identifier != identifier),
+            JobResult(identifier, mimetype, tier=writer.tier),
+        ]
+        await self.broker.update_job(job)
+        config = self.broker.config
+        return _ResultWriter(
+            writer, config.inline_result_max_size, config.handoff_max_size
+        )
+
+    async def _update_result_tier(self, job, identifier, writer):
+        """ Record the tier of an output, once the result backend chose it.
+        """
+        for result in job.results:
+            if result.identifier == identifier and result.tier != writer.tier:
+                result.tier = writer.tier
+                await self.broker.update_job(job)
+
+    async def _close_result(self, job, identifier, writer):
+        """ Complete an output and record its size, and its value when it is
+            small enough to be sent inline.
+        """
+        await writer.close()
+        for result in job.results:
+            if result.identifier == identifier:
+                result.size = writer.size
+                result.data = writer.data
+                result.tier = writer.tier
+        await self.broker.update_job(job)
+        if writer.handoff_data is not None:
+            self._keep_handoff_result(job.identifier, identifier, writer.handoff_data)
+
+    async def _store_result(self, job, result):
+        """ Write the result of an output to the result backend. Files and
+            iterators are streamed in chunks.
+        """
+        identifier, mimetype = self._get_output(job, result.identifier)
+        output = result.output
+        if isinstance(output, Output):
+            mimetype = output.mimetype or mimetype
+            if output.filename is not None:
+                with open(output.filename, 'rb') as f:
+                    await self._stream_result(job, identifier, mimetype, f)
+                return
+            output = output.file if output.file is not None else output.data
+
+        if hasattr(output, 'read') or isinstance(output, Iterator):
+            await self._stream_result(job, identifier, mimetype, output)
+        else:
+            data = to_bytes(output)
+            writer = await self._open_result(job, identifier, mimetype, len(data))
+            await writer.write(data)
+            await self._close_result(job, identifier, writer)
+
+    async def _stream_result(self, job, identifier, mimetype, source):
+        if hasattr(source, 'read'):
+            read = partial(source.read, self.broker.config.result_chunk_size)
+        else:
+            read = partial(next, source, b'')
+
+        writer = await self._open_result(job, identifier, mimetype)
+        while True:
+            data = await self.loop.run_in_executor(self.executor, read)
+            if not data:
+                break
+            await writer.write(data)
+            await self._update_result_tier(job, identifier, writer)
+        await self._close_result(job, identifier, writer)
+
+    async def _write_result_part(self, job, part):
+        identifier, mimetype = self._get_output(job, part.identifier)
+        writers = self.result_writers.setdefault(job.identifier, {})
+        writer = writers.get(identifier)
+        if writer is None:
+            writer = await self._open_result(job, identifier, mimetype)
+            writers[identifier] = writer
+        await writer.write(part.data)
+        await self._update_result_tier(job, identifier, writer)
+
+    async def _close_result_writers(self, job, discard=False):
+        """ Complete the incrementally written outputs of the job, or delete
+            them when the job did not succeed.
+        """
+        writers = self.result_writers.pop(job.identifier, {})
+        for identifier, writer in writers.items():
+            if discard:
+                await writer.close()
+                await self.backend.delete_job_result(job.identifier, identifier)
+            else:
+                await self._close_result(job, identifier, writer)
+        if discard and writers:
+            job.results = [
+                result for result in job.results
+                if result.identifier not in writers
+            ]
 
     async def _handle_job_exception(self, job, exception):
         logger.error(f'Handling exception for job {job.identifier}')
         logger.exception(exception)
+        await self._close_result_writers(job, discard=True)
         job.status = JobStatus.FAILED
         job.exception = exception
         job.traceback = traceback.format_exception(
             type(exception), exception, exception.__traceback__
         )
         await self.broker.update_job(job)
-    
+        await self.broker.fail_dependent_jobs(job)
+        await self._track_job_storage(job)
+
     async def _handle_job_cancelled(self, job):
+        await self._close_result_writers(job, discard=True)
         job.status = JobStatus.DISMISSED
         await self.broker.update_job(job)
+        await self.broker.fail_dependent_jobs(job)
+        await self._track_job_storage(job)
+
+    async def _handle_job_paused(self, job):
+        # jobs with partial outputs are not paused, see `_take_pause_request`
+        await self._close_result_writers(job, discard=True)
+        job.status = JobStatus.PAUSED
+        await self.broker.update_job(job)
 
     async def _handle_job_finished(self, job):
+        await self._close_result_writers(job)
         job.status = JobStatus.SUCCEEDED
+        # render the Result document once, instead of on every request
+        config = self.broker.config
+        job.result_document = encode_response(
+            ResultDocument.from_job(job, config), config
+        )
         await self.broker.update_job(job)
+        if job.cache_key:
+            await self.broker.cache_job(job)
+        await self.broker.release_dependent_jobs(job)
+        await self._track_job_storage(job)
+
+    async def _track_job_storage(self, job):
+        """ Account for the outputs of a completed job, evicting older jobs
+            when the storage quota is exceeded.
+        """
+        stored_size = await self.broker.track_job_storage(job)
+        max_size = self.broker.config.retention_max_size
+        if max_size is not None and stored_size > max_size:
+            await self.retention.enforce_quota()
 